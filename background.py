@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import database as db
+import metrics
+from config import (
+    WAL_CHECKPOINT_INTERVAL, PROFILE_SWEEP_INTERVAL, PROFILE_SWEEP_BATCH,
+    PROFILE_EXPIRY_NOTIFY_HOURS, SEND_RATE, TRANSACTIONS_HOT_DAYS,
+    ARCHIVE_INTERVAL, ARCHIVE_BATCH
+)
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+async def run_periodic(interval: float, func: Callable[[], Awaitable], name: str) -> None:
+    """Вызывает func каждые interval секунд, ошибки только логируются"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Фоновая задача %s завершилась с ошибкой", name)
+
+def spawn(coro: Awaitable, name: str) -> asyncio.Task:
+    # Задачи, запущенные из обработчика, не должны копить время в его статистику
+    task = asyncio.create_task(metrics.detached(coro), name=name)
+    _tasks.append(task)
+    task.add_done_callback(lambda t: t in _tasks and _tasks.remove(t))
+    return task
+
+# ===== ОГРАНИЧЕНИЕ СКОРОСТИ =====
+class TokenBucket:
+    """Не больше rate операций в секунду, всплески до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Остановить выдачу на seconds (например, по retry_after от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+# Лимит Telegram считается на бота: рассылки и уведомления берут токены из одного ведра
+send_bucket = TokenBucket(SEND_RATE)
+# Попыток отправить одно сообщение, если Telegram отвечает retry_after
+SEND_ATTEMPTS = 3
+
+# ===== НЕДОСТУПНЫЕ ПОЛУЧАТЕЛИ =====
+DEAD_CHAT_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "user not found")
+
+def is_unreachable_error(error: Exception) -> bool:
+    """Ошибка означает, что пользователю больше не отправить сообщение"""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        return any(reason in error.message.lower() for reason in DEAD_CHAT_ERRORS)
+    return False
+
+# ===== ОЧЕРЕДЬ УВЕДОМЛЕНИЙ =====
+_bot: Optional[Bot] = None
+_notifications: asyncio.Queue = asyncio.Queue()
+
+def notify(user_id: int, text: str) -> None:
+    """Ставит личное сообщение в очередь, отправка делит send_bucket с рассылками"""
+    _notifications.put_nowait((user_id, text, 0))
+
+async def notification_sender() -> None:
+    while True:
+        user_id, text, attempt = await _notifications.get()
+        # Ошибка БД или сети не должна останавливать отправителя: его никто не перезапустит
+        try:
+            user = await db.get_user(user_id)
+            if user and not user['reachable']:
+                continue
+            await send_bucket.acquire()
+            await _bot.send_message(user_id, text, parse_mode="HTML")
+        except asyncio.CancelledError:
+            raise
+        except TelegramRetryAfter as e:
+            logger.warning("Уведомления: retry_after %s с", e.retry_after)
+            send_bucket.pause(e.retry_after)
+            # Повтор после паузы: напоминание об анкете, например, уже помечено отправленным
+            if attempt + 1 < SEND_ATTEMPTS:
+                _notifications.put_nowait((user_id, text, attempt + 1))
+            else:
+                logger.warning("Уведомление %s не доставлено за %s попыток", user_id, SEND_ATTEMPTS)
+        except Exception as e:
+            logger.debug("Уведомление %s не доставлено: %s", user_id, e)
+            if is_unreachable_error(e):
+                try:
+                    await db.mark_users_unreachable([user_id])
+                except Exception:
+                    logger.exception("Не удалось пометить %s недоступным", user_id)
+
+# ===== ОТЛОЖЕННАЯ ДОСТАВКА =====
+# Куча (срок, номер, фабрика корутины). Обработчик ставит сообщение и сразу завершается,
+# а одна задача-планировщик спит до ближайшего срока и запускает отправку отдельной задачей
+_deliveries: List[tuple] = []
+_delivery_seq = itertools.count()
+_delivery_wakeup = asyncio.Event()
+_delivery_task: Optional[asyncio.Task] = None
+
+def deliver_later(delay: float, send: Callable[[], Awaitable], name: str = "delivery") -> None:
+    """Вызывает send() через delay секунд (например, результат игры после анимации кубика)"""
+    global _delivery_task
+    heapq.heappush(_deliveries, (time.monotonic() + delay, next(_delivery_seq), send, name))
+    _delivery_wakeup.set()
+    # Планировщик запускается при первой отложенной отправке
+    if _delivery_task is None or _delivery_task.done():
+        _delivery_task = spawn(delivery_scheduler(), "delivery_scheduler")
+
+async def _deliver(send: Callable[[], Awaitable], name: str) -> None:
+    try:
+        await send()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning("Отложенная отправка %s не удалась: %s", name, e)
+
+async def delivery_scheduler() -> None:
+    while True:
+        _delivery_wakeup.clear()
+        now = time.monotonic()
+        while _deliveries and _deliveries[0][0] <= now:
+            _, _, send, name = heapq.heappop(_deliveries)
+            spawn(_deliver(send, name), name)
+        timeout = _deliveries[0][0] - now if _deliveries else None
+        try:
+            # Новая отправка может оказаться раньше ближайшей — wakeup прервёт сон
+            await asyncio.wait_for(_delivery_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def flush_deliveries() -> None:
+    """Отправляет всё отложенное сразу: при остановке результаты не должны потеряться"""
+    pending = [heapq.heappop(_deliveries) for _ in range(len(_deliveries))]
+    await asyncio.gather(*(_deliver(send, name) for _, _, send, name in pending))
+
+# ===== ЗАДАЧИ =====
+async def wal_checkpoint() -> None:
+    busy, log, checkpointed = await db.checkpoint_wal()
+    logger.debug("WAL чекпоинт: busy=%s, log=%s, checkpointed=%s", busy, log, checkpointed)
+
+PROFILE_KIND_NAMES = {"player": "игрока", "clan": "клана"}
+
+async def sweep_profiles() -> None:
+    deleted = await db.delete_expired_profiles(PROFILE_SWEEP_BATCH)
+    if deleted:
+        logger.info("Удалено просроченных анкет: %s", deleted)
+
+    if not PROFILE_EXPIRY_NOTIFY_HOURS or _bot is None:
+        return
+
+    expiring = await db.claim_expiring_profiles(timedelta(hours=PROFILE_EXPIRY_NOTIFY_HOURS))
+    for profile in expiring:
+        notify(
+            profile['user_id'],
+            f"⏳ Ваша анкета {PROFILE_KIND_NAMES[profile['kind']]} скоро истечёт.\n\n"
+            f"Создайте новую в разделе <b>👥 Тиммейты</b>, чтобы остаться в списке."
+        )
+
+async def archive_ledger() -> None:
+    moved = await db.archive_transactions(timedelta(days=TRANSACTIONS_HOT_DAYS), ARCHIVE_BATCH)
+    if moved:
+        logger.info("В архив перенесено транзакций: %s", moved)
+
+def start_background_tasks(bot: Optional[Bot] = None) -> None:
+    global _bot
+    _bot = bot
+    spawn(run_periodic(WAL_CHECKPOINT_INTERVAL, wal_checkpoint, "wal_checkpoint"), "wal_checkpoint")
+    spawn(run_periodic(PROFILE_SWEEP_INTERVAL, sweep_profiles, "sweep_profiles"), "sweep_profiles")
+    spawn(run_periodic(ARCHIVE_INTERVAL, archive_ledger, "archive_ledger"), "archive_ledger")
+    if bot is not None:
+        spawn(notification_sender(), "notification_sender")
+
+async def stop_background_tasks() -> None:
+    await flush_deliveries()
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,510 @@
+"""Масштабный бенчмарк database.py: каждая публичная функция на базе из 10k / 100k / 1M пользователей
+
+Генератор заполняет users, transactions, completed_tasks, game_orders, promo_uses, bets
+(и понемногу остальные таблицы) пачками через executemany. Затем каждый сценарий
+вызывается --repeat раз на случайных id, и для каждого масштаба печатается p50/p95.
+В конце — сводка p50 по масштабам: запрос, который растёт вместе с таблицей
+(кроме заведомо полных обходов вроде archive_transactions), помечен ⚠. --save сохраняет отчёт в JSON, --baseline сравнивает с сохранённым.
+
+Запуск: python benchmarks/bench_database.py [--scale 10000,100000,1000000] [--repeat 30]
+                                            [--save report.json] [--baseline report.json]
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import metrics
+
+# ===== ОБЪЁМ ДАННЫХ =====
+# Строк на одного пользователя
+TRANSACTIONS_PER_USER = 5
+COMPLETED_TASKS_PER_USER = 0.5
+GAME_ORDERS_PER_USER = 0.2
+PROMO_USES_PER_USER = 0.5
+USER_TASKS_PER_USER = 0.1
+WITHDRAWALS_PER_USER = 0.05
+PROFILES_PER_USER = 0.01
+BETS_PER_USER = 2
+# Таблицы, которые не растут вместе с аудиторией
+GAME_TASKS = 200
+CARD_TASKS = 50
+PROMOCODES = 100
+MARKET_ITEMS = 20
+ADMINS = 10
+
+HISTORY_DAYS = 90               # Даты строк равномерно за последние N дней
+BATCH = 50000                   # Строк на executemany + commit
+# Пороги ⚠ в сводке; замеры быстрее 1 мс не помечаются — там шумит планировщик
+GROWTH_ALERT = 3.0              # p50 вырос больше чем в N раз от меньшего масштаба к большему
+REGRESSION_ALERT = 1.5          # p50 медленнее базового отчёта больше чем в N раз
+
+VOWELS = "aeiouy"
+CONSONANTS = "bcdfghjklmnprstvwxz"
+
+def random_name(rng: random.Random) -> str:
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 5)))
+
+def random_time(rng: random.Random, now: datetime) -> str:
+    # Формат CURRENT_TIMESTAMP, как у строк, вставленных самим ботом
+    moment = now - timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+# ===== ГЕНЕРАТОР =====
+async def insert(conn, sql: str, total: int, make_row: Callable[[int], tuple]) -> None:
+    for start in range(0, total, BATCH):
+        await conn.executemany(sql, [make_row(n) for n in range(start, min(start + BATCH, total))])
+        await conn.commit()
+
+async def generate(users: int, seed: int = 42) -> None:
+    rng = random.Random(seed)
+    now = datetime.now()
+    user_id = lambda: rng.randint(1, users)
+
+    async with db.acquire() as conn:
+        await insert(conn, '''
+            INSERT INTO users (user_id, username, full_name, balance, demo_balance, total_earned,
+                               tasks_completed, privilege, game_server, game_nickname,
+                               is_registered, registered_at, reachable)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', users, lambda n: (
+            n + 1,
+            random_name(rng) + str(rng.randint(0, 999)),
+            random_name(rng).capitalize() + " " + random_name(rng).capitalize(),
+            rng.randint(0, 500),
+            rng.randint(0, 5000),
+            rng.choice((0, 0, rng.randint(1, 10000))),
+            rng.randint(0, 30),
+            rng.choice(("newbie", "trainee", "strong")),
+            "EU Main",
+            random_name(rng),
+            rng.random() < 0.8,
+            random_time(rng, now),
+            rng.random() > 0.02,
+        ))
+
+        await insert(conn, '''
+            INSERT INTO transactions (user_id, amount, type, description, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', int(users * TRANSACTIONS_PER_USER), lambda n: (
+            user_id(),
+            rng.randint(-100, 100),
+            rng.choice(("earn", "spend", "demo")),
+            "bench",
+            random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO bets (user_id, game, stake, payout, is_demo, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', int(users * BETS_PER_USER), lambda n: (
+            user_id(),
+            rng.choice(("cube", "basketball", "darts", "roulette", "minesweeper")),
+            50,
+            rng.choice((0, 0, 0, 100)),
+            rng.random() < 0.7,
+            random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO game_tasks (admin_id, server_name, clan_name, game_nick, resource_category,
+                                    resource_type, resource_amount, reward, status, created_at)
+            VALUES (?, 'EU Main', 'Bench', 'bench', 'resources', 'wood', ?, ?, ?, ?)
+        ''', GAME_TASKS, lambda n: (
+            1, rng.randint(100, 5000), rng.randint(1, 50),
+            rng.choice(("active", "completed")), random_time(rng, now),
+        ))
+        await insert(conn, '''
+            INSERT INTO card_tasks (admin_id, card_name, referral_link, reward, status, created_at)
+            VALUES (?, 'Bench', 'https://example.com', ?, ?, ?)
+        ''', CARD_TASKS, lambda n: (1, rng.randint(1, 50), rng.choice(("active", "completed")),
+                                    random_time(rng, now)))
+
+        # Большинство уже проверено: очередь модерации небольшая, как в жизни
+        await insert(conn, '''
+            INSERT INTO completed_tasks (user_id, task_id, task_type, proof_file_id, status, submitted_at)
+            VALUES (?, ?, ?, 'proof', ?, ?)
+        ''', int(users * COMPLETED_TASKS_PER_USER), lambda n: (
+            user_id(),
+            rng.randint(1, GAME_TASKS),
+            rng.choice(("game", "card", "order")),
+            rng.choices(("completed", "rejected", "pending"), (0.8, 0.18, 0.02))[0],
+            random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO game_orders (creator_id, executor_id, resource_category, resource_type,
+                                     resource_amount, total_reward, executor_reward, status, created_at)
+            VALUES (?, ?, 'resources', 'wood', ?, ?, ?, ?, ?)
+        ''', int(users * GAME_ORDERS_PER_USER), lambda n: (
+            user_id(),
+            rng.choice((None, user_id())),
+            rng.randint(100, 5000),
+            20, 13,
+            rng.choices(("open", "in_progress", "completed", "cancelled"), (0.1, 0.1, 0.7, 0.1))[0],
+            random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO promocodes (code, coins, max_uses, current_uses, created_by, is_active)
+            VALUES (?, ?, ?, 0, 1, ?)
+        ''', PROMOCODES, lambda n: (f"BENCH{n}", rng.randint(1, 100), users, n % 4 != 0))
+        # Пара (user_id, promo_id) уникальна — повторы отбрасывает OR IGNORE
+        await insert(conn, '''
+            INSERT OR IGNORE INTO promo_uses (user_id, promo_id, used_at) VALUES (?, ?, ?)
+        ''', int(users * PROMO_USES_PER_USER), lambda n: (
+            user_id(), rng.randint(1, PROMOCODES), random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO user_tasks (user_id, task_type, item_type, item_amount, price_paid, status)
+            VALUES (?, 'buy', 'wood', ?, ?, ?)
+        ''', int(users * USER_TASKS_PER_USER), lambda n: (
+            user_id(), rng.randint(100, 5000), rng.randint(1, 50),
+            rng.choice(("pending", "completed")),
+        ))
+        await insert(conn, '''
+            INSERT INTO withdraw_requests (user_id, pack_id, coins, game_id, status, created_at)
+            VALUES (?, 'pack_290', 290, 'bench', ?, ?)
+        ''', int(users * WITHDRAWALS_PER_USER), lambda n: (
+            user_id(), rng.choices(("completed", "rejected", "pending"), (0.8, 0.1, 0.1))[0],
+            random_time(rng, now),
+        ))
+
+        await insert(conn, '''
+            INSERT INTO market_items (name, price, description, reward_type, reward_value)
+            VALUES (?, ?, 'bench', 'privilege', 'strong')
+        ''', MARKET_ITEMS, lambda n: (f"Item {n}", rng.randint(10, 500)))
+        await insert(conn, '''
+            INSERT OR IGNORE INTO admins (user_id, username, clan_name, game_nick, server_name)
+            VALUES (?, ?, 'Bench', 'bench', 'EU Main')
+        ''', ADMINS, lambda n: (n + 1, f"admin{n}"))
+
+        # Анкеты уникальны по user_id: берём подряд идущих пользователей
+        profiles = max(1, int(users * PROFILES_PER_USER))
+        await insert(conn, '''
+            INSERT INTO player_profiles (user_id, age, hours_played, real_name, nickname, server,
+                                         prev_clans, expires_at, created_at)
+            VALUES (?, 20, '1000', 'Bench', 'bench', 'EU Main', '-', ?, ?)
+        ''', profiles, lambda n: (
+            n + 1,
+            (now + timedelta(hours=rng.randint(-48, 168))).strftime("%Y-%m-%d %H:%M:%S"),
+            random_time(rng, now),
+        ))
+        await insert(conn, '''
+            INSERT INTO clan_profiles (user_id, clan_name, clan_tag, founded_date, server,
+                                       hours_required, expires_at, created_at)
+            VALUES (?, 'Bench', 'BN', '2024', 'EU Main', 1000, ?, ?)
+        ''', profiles, lambda n: (
+            n + 1,
+            (now + timedelta(hours=rng.randint(-48, 336))).strftime("%Y-%m-%d %H:%M:%S"),
+            random_time(rng, now),
+        ))
+
+        # Кэши в памяти строятся в init_db — перечитываем после заливки
+        await db._load_leaderboard(conn)
+        await db._load_admin_roster(conn)
+        await conn.execute("ANALYZE")
+        await conn.commit()
+    await db.rebuild_stats()
+
+# ===== СЦЕНАРИИ =====
+class Context:
+    """Случайные аргументы для сценариев и очереди строк, которые можно обработать ровно один раз"""
+
+    def __init__(self, users: int, seed: int = 7):
+        self.users = users
+        self.rng = random.Random(seed)
+        self.queues: Dict[str, List[tuple]] = {}
+        self.sequence = 0
+
+    def user(self) -> int:
+        return self.rng.randint(1, self.users)
+
+    def admin(self) -> int:
+        return self.rng.randint(1, ADMINS)
+
+    def next(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+    def pick(self, count: float) -> int:
+        """Случайный id таблицы из count строк"""
+        return self.rng.randint(1, max(1, int(count)))
+
+    async def load_queue(self, name: str, sql: str) -> None:
+        async with db.acquire() as conn:
+            cursor = await conn.execute(sql)
+            self.queues[name] = [tuple(row) for row in await cursor.fetchall()]
+
+    def take(self, name: str) -> tuple:
+        """Следующая строка очереди; когда очередь кончилась — несуществующие id"""
+        queue = self.queues[name]
+        return queue.pop() if queue else (0, 0)
+
+async def prepare_context(ctx: Context) -> None:
+    await ctx.load_queue("pending_submissions",
+                         "SELECT id FROM completed_tasks WHERE status = 'pending' LIMIT 1000")
+    await ctx.load_queue("pending_withdrawals",
+                         "SELECT id FROM withdraw_requests WHERE status = 'pending' LIMIT 1000")
+    await ctx.load_queue("open_orders",
+                         "SELECT id, creator_id FROM game_orders WHERE status = 'open' LIMIT 2000")
+    await ctx.load_queue("unpaid_bets", "SELECT id, user_id FROM bets WHERE payout = 0 LIMIT 1000")
+
+async def drain(iterator, limit: int) -> int:
+    count = 0
+    async for _ in iterator:
+        count += 1
+        if count >= limit:
+            break
+    return count
+
+async def second_page(fetch) -> tuple:
+    first = await fetch()
+    next_cursor = first[-1]
+    return await fetch(next_cursor) if next_cursor else first
+
+# Функция -> фабрика корутины. Несколько вариантов одной функции: "имя[вариант]"
+READS: Dict[str, Callable] = {
+    "get_user": lambda c: db.get_user(c.user()),
+    "get_top_users": lambda c: db.get_top_users(10),
+    "get_user_rank": lambda c: db.get_user_rank(c.user()),
+    "search_users[ник]": lambda c: db.search_users(random_name(c.rng)[:4]),
+    "search_users[id]": lambda c: db.search_users(str(c.user())),
+    "is_admin": lambda c: db.is_admin(c.user()),
+    "is_main_admin": lambda c: db.is_main_admin(c.user()),
+    "get_admin": lambda c: db.get_admin(c.admin()),
+    "get_all_admins": lambda c: db.get_all_admins(),
+    "get_active_game_tasks": lambda c: db.get_active_game_tasks(),
+    "get_active_game_tasks[стр. 2]": lambda c: second_page(db.get_active_game_tasks),
+    "get_game_task": lambda c: db.get_game_task(c.pick(GAME_TASKS)),
+    "get_active_card_tasks": lambda c: db.get_active_card_tasks(),
+    "get_card_task": lambda c: db.get_card_task(c.pick(CARD_TASKS)),
+    "get_user_active_tasks_count": lambda c: db.get_user_active_tasks_count(c.user()),
+    "get_user_tasks": lambda c: db.get_user_tasks(c.user()),
+    "get_pending_submissions": lambda c: db.get_pending_submissions(),
+    "get_submission": lambda c: db.get_submission(c.pick(c.users * COMPLETED_TASKS_PER_USER)),
+    "get_user_submissions": lambda c: db.get_user_submissions(c.user()),
+    "has_user_submitted_task": lambda c: db.has_user_submitted_task(c.user(), c.pick(GAME_TASKS), "game"),
+    "get_pending_withdrawals": lambda c: db.get_pending_withdrawals(),
+    "get_withdrawal": lambda c: db.get_withdrawal(c.pick(c.users * WITHDRAWALS_PER_USER)),
+    "get_user_withdrawals": lambda c: db.get_user_withdrawals(c.user()),
+    "get_promocode": lambda c: db.get_promocode(f"BENCH{c.rng.randrange(PROMOCODES)}"),
+    "get_all_promocodes": lambda c: db.get_all_promocodes(),
+    "get_market_items": lambda c: db.get_market_items(),
+    "get_market_item": lambda c: db.get_market_item(c.pick(MARKET_ITEMS)),
+    "has_purchased_item": lambda c: db.has_purchased_item(c.user(), c.pick(MARKET_ITEMS)),
+    "get_player_profile": lambda c: db.get_player_profile(c.pick(c.users * PROFILES_PER_USER)),
+    "get_player_profiles_page": lambda c: db.get_player_profiles_page(),
+    "get_clan_profile": lambda c: db.get_clan_profile(c.pick(c.users * PROFILES_PER_USER)),
+    "get_clan_profiles_page": lambda c: db.get_clan_profiles_page(),
+    "get_stats": lambda c: db.get_stats(),
+    "get_game_stats[30 дн.]": lambda c: db.get_game_stats(datetime.now() - timedelta(days=30)),
+    "get_open_orders": lambda c: db.get_open_orders(),
+    "get_open_orders[стр. 2]": lambda c: second_page(db.get_open_orders),
+    "get_all_orders_admin": lambda c: db.get_all_orders_admin(),
+    "get_order": lambda c: db.get_order(c.pick(c.users * GAME_ORDERS_PER_USER)),
+    "get_user_orders": lambda c: db.get_user_orders(c.user()),
+    "get_subscription_channels": lambda c: db.get_subscription_channels(),
+    "get_user_subscription": lambda c: db.get_user_subscription(c.user(), "@bench"),
+    "iter_user_ids[1k]": lambda c: drain(db.iter_user_ids("reachable"), 1000),
+    "get_broadcast_job": lambda c: db.get_broadcast_job(1),
+    "get_running_broadcast_jobs": lambda c: db.get_running_broadcast_jobs(),
+    "load_fsm_state": lambda c: db.load_fsm_state(f"1:{c.user()}:{c.user()}::default"),
+    "get_user_transactions": lambda c: db.get_user_transactions(c.user()),
+    "get_archived_transactions": lambda c: db.get_archived_transactions(c.user()),
+    "get_archived_totals": lambda c: db.get_archived_totals(c.user()),
+}
+
+WRITES: Dict[str, Callable] = {
+    "create_user": lambda c: db.create_user(c.users + c.next(), "bench_new", "Bench New"),
+    "complete_registration": lambda c: db.complete_registration(c.user(), "EU Main", "bench"),
+    "update_balance": lambda c: db.update_balance(c.user(), 5, "bench"),
+    "update_balance[sync]": lambda c: db.update_balance(c.user(), 5, "bench", durability=db.DURABILITY_SYNC),
+    "debit_if_sufficient": lambda c: db.debit_if_sufficient(c.user(), 5, "bench"),
+    "settle_bet": lambda c: db.settle_bet(c.user(), "cube", 10, c.rng.choice((0, 20))),
+    "pay_bet": lambda c: db.pay_bet(*c.take("unpaid_bets"), 20),
+    "set_user_balance": lambda c: db.set_user_balance(c.user(), 100),
+    "set_user_privilege": lambda c: db.set_user_privilege(c.user(), "trainee"),
+    "update_user_privilege_by_days": lambda c: db.update_user_privilege_by_days(c.user()),
+    "increment_completed_tasks": lambda c: db.increment_completed_tasks(c.user()),
+    "add_promo_ability": lambda c: db.add_promo_ability(c.user()),
+    "use_promo_ability": lambda c: db.use_promo_ability(c.user()),
+    "claim_daily_bonus": lambda c: db.claim_daily_bonus(c.user()),
+    "add_admin": lambda c: db.add_admin(ADMINS + c.next(), "bench", "Bench", "bench", "EU Main"),
+    "update_admin_profile": lambda c: db.update_admin_profile(c.admin(), "Bench", "bench", "EU Main"),
+    "reload_admin_roster": lambda c: db.reload_admin_roster(),
+    "create_game_task": lambda c: db.create_game_task(1, "EU Main", "Bench", "bench", "resources", "wood", 1000, 10),
+    "complete_game_task": lambda c: db.complete_game_task(c.pick(GAME_TASKS)),
+    "create_card_task": lambda c: db.create_card_task(1, "Bench", "https://example.com", "bench", 10),
+    "complete_card_task": lambda c: db.complete_card_task(c.pick(CARD_TASKS)),
+    "create_user_task": lambda c: db.create_user_task(c.user(), "buy", "wood", 1000, 10),
+    "submit_task": lambda c: db.submit_task(c.user(), c.pick(GAME_TASKS), "game", "proof"),
+    "approve_submission": lambda c: db.approve_submission(c.take("pending_submissions")[0], 1),
+    "reject_submission": lambda c: db.reject_submission(c.take("pending_submissions")[0], 1, "bench"),
+    "create_withdraw_request": lambda c: db.create_withdraw_request(c.user(), "pack_290", 290, "bench"),
+    "complete_withdrawal": lambda c: db.complete_withdrawal(c.take("pending_withdrawals")[0], 1),
+    "reject_withdrawal": lambda c: db.reject_withdrawal(c.take("pending_withdrawals")[0], 1, "bench"),
+    "create_promocode": lambda c: db.create_promocode(f"NEW{c.next()}", 10, 100, 1),
+    "use_promocode": lambda c: db.use_promocode(c.user(), c.rng.randint(1, PROMOCODES)),
+    "create_market_item": lambda c: db.create_market_item("Bench", 10, "bench", "privilege", "strong"),
+    "purchase_market_item": lambda c: db.purchase_market_item(c.user(), c.pick(MARKET_ITEMS)),
+    "cancel_market_purchase": lambda c: db.cancel_market_purchase(c.user(), c.pick(MARKET_ITEMS)),
+    "create_player_profile": lambda c: db.create_player_profile(c.user(), 20, "1000", "Bench", "bench", "EU Main", "-"),
+    "create_clan_profile": lambda c: db.create_clan_profile(c.user(), "Bench", "BN", "", "2024", "EU Main", 1000),
+    "claim_expiring_profiles": lambda c: db.claim_expiring_profiles(timedelta(hours=24)),
+    "create_game_order": lambda c: db.create_game_order(c.user(), "resources", "wood", 1000, 20, 13),
+    "take_order": lambda c: db.take_order(c.take("open_orders")[0], c.user()),
+    "complete_order": lambda c: db.complete_order(c.pick(c.users * GAME_ORDERS_PER_USER)),
+    "set_order_status": lambda c: db.set_order_status(c.pick(c.users * GAME_ORDERS_PER_USER), "completed"),
+    "cancel_order": lambda c: db.cancel_order(*c.take("open_orders")),
+    "add_subscription_channel": lambda c: db.add_subscription_channel(f"@bench{c.next()}", "Bench"),
+    "add_user_subscription": lambda c: db.add_user_subscription(c.user(), "@bench"),
+    "remove_user_subscription": lambda c: db.remove_user_subscription(c.user(), "@bench"),
+    "remove_subscription_channel": lambda c: db.remove_subscription_channel(f"@bench{c.sequence}"),
+    "mark_users_unreachable[100]": lambda c: db.mark_users_unreachable([c.user() for _ in range(100)]),
+    "mark_user_reachable": lambda c: db.mark_user_reachable(c.user()),
+    "create_broadcast_job": lambda c: db.create_broadcast_job(1, 1, 1, "bench"),
+    "save_broadcast_progress": lambda c: db.save_broadcast_progress(1, c.user(), 10, 1),
+    "finish_broadcast_job": lambda c: db.finish_broadcast_job(1),
+    "save_fsm_states[100]": lambda c: db.save_fsm_states(
+        [(f"1:{u}:{u}::default", "Bench:state", "{}") for u in (c.user() for _ in range(100))], []
+    ),
+    "remove_admin": lambda c: db.remove_admin(ADMINS + c.sequence),
+    "delete_game_task": lambda c: db.delete_game_task(c.pick(GAME_TASKS)),
+    "delete_promocode": lambda c: db.delete_promocode(c.rng.randint(1, PROMOCODES)),
+    "delete_market_item": lambda c: db.delete_market_item(c.pick(MARKET_ITEMS)),
+}
+
+# Обходят или перестраивают целые таблицы: по одному разу, в этом порядке
+MAINTENANCE: Dict[str, Callable] = {
+    "rebuild_stats": lambda c: db.rebuild_stats(),
+    "delete_expired_profiles": lambda c: db.delete_expired_profiles(),
+    "delete_stale_fsm_states": lambda c: db.delete_stale_fsm_states(timedelta(days=7)),
+    "archive_transactions": lambda c: db.archive_transactions(timedelta(days=30)),
+    "checkpoint_wal": lambda c: db.checkpoint_wal(),
+    "reset_leaderboard": lambda c: db.reset_leaderboard(),
+}
+
+# Инфраструктура без запросов к данным — сценарии им не нужны
+NOT_BENCHMARKED = {"apply_pragmas", "open_pool", "acquire", "close_db", "init_db", "run_migrations",
+                   "get_pool_stats", "get_user_cache_stats", "get_ledger", "get_ledger_stats",
+                   "generate_promo_code"}
+
+def uncovered() -> List[str]:
+    """Публичные функции database.py без сценария — новая функция должна попасть в бенчмарк"""
+    covered = {name.split("[")[0] for name in (*READS, *WRITES, *MAINTENANCE)}
+    public = {
+        name for name, obj in vars(db).items()
+        if inspect.isfunction(obj) and obj.__module__ == db.__name__ and not name.startswith("_")
+    }
+    return sorted(public - covered - NOT_BENCHMARKED)
+
+# ===== ЗАМЕРЫ =====
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def measure(scenarios: Dict[str, Callable], ctx: Context, repeat: int) -> Dict[str, Dict]:
+    results = {}
+    for name, make in scenarios.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await make(ctx)
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {"p50": percentile(timings, 50), "p95": percentile(timings, 95)}
+    return results
+
+async def run_scale(users: int, repeat: int) -> Dict[str, Dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        db.ARCHIVE_DATABASE_PATH = os.path.join(tmp, "bench_archive.db")
+        db._user_cache.clear()
+        await db.init_db()
+        try:
+            started = time.perf_counter()
+            await generate(users)
+            print(f"\n=== {users:,} пользователей: данные за {time.perf_counter() - started:.1f} с ===")
+
+            ctx = Context(users)
+            await prepare_context(ctx)
+            metrics.reset_db_stats()
+            results = await measure(READS, ctx, repeat)
+            results.update(await measure(WRITES, ctx, repeat))
+            results.update(await measure(MAINTENANCE, ctx, 1))
+
+            print(f"{'функция':<34} {'p50, мс':>9} {'p95, мс':>9}")
+            for name, result in results.items():
+                print(f"{name:<34} {result['p50']:>9.2f} {result['p95']:>9.2f}")
+
+            print("\nСамые затратные SQL-запросы:")
+            for stat in metrics.get_db_statement_stats()[:5]:
+                sql = " ".join(stat["name"].split())[:90]
+                print(f"  {stat['total_ms']:>9.1f} мс ×{stat['count']:<5} {sql}")
+        finally:
+            # Потоки aiosqlite не дадут процессу завершиться, если пул не закрыть
+            await db.close_db()
+    return results
+
+def print_summary(report: Dict[str, Dict[str, Dict]], baseline: Dict) -> None:
+    scales = list(report)
+    header = "".join(f"{int(scale):>12,}" for scale in scales)
+    print(f"\n=== p50 по масштабам, мс ===\n{'функция':<34}{header}")
+    for name in report[scales[0]]:
+        cells, alerts = [], []
+        for scale in scales:
+            p50 = report[scale][name]["p50"]
+            cells.append(f"{p50:>12.2f}")
+            old = baseline.get(scale, {}).get(name)
+            if old and p50 > old["p50"] * REGRESSION_ALERT and p50 > 1:
+                alerts.append(f"медленнее базы на {scale}: {old['p50']:.2f} → {p50:.2f}")
+        first, last = report[scales[0]][name]["p50"], report[scales[-1]][name]["p50"]
+        # Обслуживание обходит таблицы целиком и растёт с ними по определению
+        if len(scales) > 1 and name not in MAINTENANCE and last > 1 \
+                and last > max(first, 0.1) * GROWTH_ALERT:
+            alerts.append(f"растёт с данными ×{last / max(first, 0.1):.0f}")
+        print(f"{name:<34}{''.join(cells)}  {'⚠ ' + '; '.join(alerts) if alerts else ''}")
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="10000,100000", help="Число пользователей через запятую")
+    parser.add_argument("--repeat", type=int, default=30, help="Вызовов каждой функции")
+    parser.add_argument("--save", help="Сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="Сравнить с сохранённым отчётом")
+    args = parser.parse_args()
+    # Медленные запросы видны в сводке SQL; лог с EXPLAIN на каждый был бы простынёй
+    logging.getLogger("database").setLevel(logging.ERROR)
+
+    missing = uncovered()
+    if missing:
+        print("Без сценария:", ", ".join(missing))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # Ключи — строки, чтобы отчёт совпадал с прочитанным из JSON
+    report = {}
+    for users in (int(value) for value in args.scale.split(",")):
+        report[str(users)] = await run_scale(users, args.repeat)
+
+    print_summary(report, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Коммиты/сек в стиле update_balance: настройки SQLite по умолчанию против SQLITE_PRAGMAS
+
+Запуск: python benchmarks/bench_pragmas.py [--commits 2000] [--writers 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite
+
+import database as db
+
+DEFAULT_PROFILE = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+async def prepare(path: str) -> None:
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute(
+            "CREATE TABLE users (user_id INTEGER PRIMARY KEY, balance INTEGER DEFAULT 0, "
+            "total_earned INTEGER DEFAULT 0)"
+        )
+        await conn.execute(
+            "CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+            "amount INTEGER, type TEXT, description TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        await conn.executemany("INSERT INTO users (user_id) VALUES (?)", [(i,) for i in range(1000)])
+        await conn.commit()
+
+async def writer(path: str, profile: dict, commits: int, offset: int) -> None:
+    async with aiosqlite.connect(path) as conn:
+        await db.apply_pragmas(conn, profile)
+        for i in range(commits):
+            user_id = (offset + i) % 1000
+            await conn.execute("UPDATE users SET balance = balance + 1 WHERE user_id = ?", (user_id,))
+            await conn.execute(
+                "INSERT INTO transactions (user_id, amount, type, description) VALUES (?, 1, 'real', 'bench')",
+                (user_id,)
+            )
+            await conn.commit()
+
+async def run(name: str, profile: dict, commits: int, writers: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await prepare(path)
+        per_writer = commits // writers
+        started = time.perf_counter()
+        await asyncio.gather(*[writer(path, profile, per_writer, w * per_writer) for w in range(writers)])
+        elapsed = time.perf_counter() - started
+    rate = per_writer * writers / elapsed
+    print(f"{name:<10} {per_writer * writers:>7} коммитов за {elapsed:6.2f} с  ->  {rate:9.0f} коммитов/с")
+    return rate
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    # busy_timeout нужен обоим вариантам, иначе параллельные писатели падают с "database is locked"
+    before = await run("default", dict(DEFAULT_PROFILE, busy_timeout=5000), args.commits, args.writers)
+    after = await run("profile", db.SQLITE_PRAGMAS, args.commits, args.writers)
+    print(f"ускорение: x{after / before:.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
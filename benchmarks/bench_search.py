@@ -0,0 +1,90 @@
+"""Задержка поиска пользователей: LIKE по всей таблице против FTS5 trigram (db.search_users)
+
+Запуск: python benchmarks/bench_search.py [--users 1000000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+VOWELS = "aeiouy"
+CONSONANTS = "bcdfghjklmnprstvwxz"
+
+def random_name(rng: random.Random) -> str:
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 5)))
+
+async def fill(users: int, batch: int = 50000) -> str:
+    """Заполняет users, возвращает кусок ника из середины таблицы для поиска"""
+    rng = random.Random(42)
+    sample = ""
+    async with db.acquire() as conn:
+        for start in range(0, users, batch):
+            rows = []
+            for user_id in range(start + 1, min(start + batch, users) + 1):
+                rows.append((
+                    user_id,
+                    random_name(rng) + str(rng.randint(0, 999)),
+                    random_name(rng).capitalize() + " " + random_name(rng).capitalize(),
+                    random_name(rng) + rng.choice(string.ascii_uppercase),
+                ))
+            if not sample:
+                sample = rows[len(rows) // 2][1][1:7]
+            await conn.executemany(
+                "INSERT INTO users (user_id, username, full_name, game_nickname) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            await conn.commit()
+    return sample
+
+async def like_search(query: str) -> int:
+    async with db.acquire() as conn:
+        cursor = await conn.execute('''
+            SELECT * FROM users
+            WHERE username LIKE ? OR full_name LIKE ? OR game_nickname LIKE ?
+            LIMIT 20
+        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
+        return len(await cursor.fetchall())
+
+async def timed(func, query: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await func(query)
+    return (time.perf_counter() - started) / repeat * 1000
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        if not db._users_fts:
+            print("FTS5 trigram недоступен в этой сборке SQLite")
+            return
+
+        started = time.perf_counter()
+        sample = await fill(args.users)
+        print(f"{args.users} пользователей вставлено за {time.perf_counter() - started:.1f} с")
+
+        # Редкая подстрока, частая подстрока, пустой результат и точный ID
+        queries = [sample, "kato", "qqqzzz", str(args.users // 2)]
+        print(f"{'запрос':<12} {'LIKE, мс':>10} {'FTS5, мс':>10}")
+        for query in queries:
+            like_ms = await timed(like_search, query, args.repeat)
+            fts_ms = await timed(db.search_users, query, args.repeat)
+            print(f"{query:<12} {like_ms:>10.2f} {fts_ms:>10.2f}")
+
+        await db.close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,234 @@
+"""Нагрузочный тест диспетчера: синтетические обновления через настоящие роутеры handlers/*
+
+Каждый симулированный пользователь проходит /start, капчу и регистрацию, активирует
+промокод, кликает по меню, создаёт заказ и делает ставку в демо-игре. Пользователи
+работают параллельно, обновления одного пользователя — по очереди, как в Telegram.
+Bot API подменён сессией, которая только записывает вызовы (по желанию с задержкой).
+БД — временный файл, FSM — SQLiteStorage, middleware те же, что в main.py.
+
+Запуск: python benchmarks/load_test.py [--users 1000] [--concurrency 200] [--api-latency 0]
+                                       [--no-games]
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import GetChat, GetChatMember, SendDice, TelegramMethod
+from aiogram.types import Chat, ChatMemberMember, Message, Update, User
+
+import background
+import database as db
+import metrics
+from main import create_dispatcher
+from storage import SQLiteStorage
+
+BOT_TOKEN = "42:LOAD-TEST"
+PROMO_CODE = "LOADTEST"
+
+_ids = itertools.count(1)
+
+# ===== ПОДДЕЛЬНЫЙ BOT API =====
+class RecordingSession(BaseSession):
+    """Сессия бота без сети: считает вызовы по методам и отвечает правдоподобными объектами"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="Load"))
+        if isinstance(method, GetChat):
+            return Chat(id=chat_id, type="channel", title="Load")
+        if isinstance(method, SendDice):
+            return Message.model_validate({
+                "message_id": next(_ids),
+                "date": datetime.now(),
+                "chat": {"id": chat_id, "type": "private"},
+                "dice": {"emoji": method.emoji or "🎲", "value": random.randint(1, 6)},
+            }, context={"bot": bot})
+        if type(method).__name__.startswith(("Send", "Copy")):
+            return Message.model_validate({
+                "message_id": next(_ids),
+                "date": datetime.now(),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": getattr(method, "text", None),
+            }, context={"bot": bot})
+        # edit_*, answer_callback_query, delete_message и прочее
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+# ===== СИНТЕТИЧЕСКИЕ ОБНОВЛЕНИЯ =====
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "username": f"load{user_id}"}
+
+def message_update(user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": next(_ids),
+        "message": {
+            "message_id": next(_ids),
+            "date": datetime.now(),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        },
+    })
+
+def callback_update(user_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": next(_ids),
+        "callback_query": {
+            "id": str(next(_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_ids),
+                "date": datetime.now(),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "...",
+            },
+        },
+    })
+
+# ===== СЦЕНАРИЙ =====
+class LoadTest:
+    def __init__(self, bot: Bot, dp, games: bool):
+        self.bot = bot
+        self.dp = dp
+        self.games = games
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def feed(self, step: str, update: Update) -> None:
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors[step] += 1
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+
+    async def fsm_data(self, user_id: int) -> Dict:
+        key = StorageKey(bot_id=self.bot.id, chat_id=user_id, user_id=user_id)
+        return await self.dp.storage.get_data(key)
+
+    async def run_user(self, user_id: int) -> None:
+        # Регистрация: правильный смайлик капчи берём из FSM
+        await self.feed("start", message_update(user_id, "/start"))
+        correct = (await self.fsm_data(user_id)).get("correct_emoji", "")
+        await self.feed("captcha", callback_update(user_id, f"captcha_{correct}"))
+        await self.feed("reg_server", message_update(user_id, "EU Main"))
+        await self.feed("reg_nickname", message_update(user_id, f"player{user_id}"))
+        await self.feed("reg_skip_avatar", callback_update(user_id, "skip_description"))
+        await self.feed("reg_finish", callback_update(user_id, "skip_finish"))
+
+        # Промокод даёт монеты на заказ
+        await self.feed("enter_promo", callback_update(user_id, "enter_promo"))
+        await self.feed("promo_code", message_update(user_id, PROMO_CODE))
+
+        for data in ("main_menu", "my_balance", "balance_history", "top_players",
+                     "tasks_menu", "market_menu", "teams_menu", "main_menu"):
+            await self.feed(f"menu:{data}", callback_update(user_id, data))
+
+        # Заказ: категория → ресурс → количество → награда → описание
+        await self.feed("order_start", callback_update(user_id, "create_order"))
+        await self.feed("order_category", callback_update(user_id, "category_resources"))
+        await self.feed("order_resource", callback_update(user_id, "resource_resources_wood"))
+        await self.feed("order_amount", message_update(user_id, "1000"))
+        await self.feed("order_reward", message_update(user_id, "20"))
+        await self.feed("order_description", message_update(user_id, "-"))
+
+        if self.games:
+            await self.feed("games_menu", callback_update(user_id, "games_menu"))
+            await self.feed("game_pick", callback_update(user_id, "game_basketball"))
+            await self.feed("bet_type", callback_update(user_id, "bet_demo"))
+            await self.feed("bet", message_update(user_id, "50"))
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="Одновременно активных пользователей")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Задержка ответа Bot API (мс)")
+    parser.add_argument("--no-games", action="store_true", help="Без ставки в игре")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # Под нагрузкой медленных запросов сотни — смотрите /db_stats-сводку, а не лог
+    logging.getLogger("database").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "load.db")
+        db.ARCHIVE_DATABASE_PATH = os.path.join(tmp, "load_archive.db")
+        await db.init_db()
+        await db.create_promocode(PROMO_CODE, 200, args.users * 10, 0)
+
+        session = RecordingSession(args.api_latency / 1000)
+        bot = Bot(token=BOT_TOKEN, session=session)
+        storage = SQLiteStorage()
+        dp = create_dispatcher(bot, storage)
+        test = LoadTest(bot, dp, games=not args.no_games)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def simulated(user_id: int) -> None:
+            async with semaphore:
+                await test.run_user(user_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated(1_000_000 + n) for n in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+        # Результаты игр ждут в планировщике отложенной доставки
+        await background.stop_background_tasks()
+        await storage.close()
+        await db.close_db()
+
+    all_latencies = [ms for values in test.latencies.values() for ms in values]
+    print(f"{args.users} пользователей, {len(all_latencies)} обновлений за {elapsed:.1f} с: "
+          f"{len(all_latencies) / elapsed:,.0f} обновлений/с")
+    print(f"Задержка обработчика: p50 {percentile(all_latencies, 50):.1f} мс, "
+          f"p99 {percentile(all_latencies, 99):.1f} мс\n")
+
+    print(f"{'шаг':<24} {'N':>7} {'p50, мс':>9} {'p99, мс':>9} {'ошибок':>7}")
+    for step, values in test.latencies.items():
+        print(f"{step:<24} {len(values):>7} {percentile(values, 50):>9.1f} "
+              f"{percentile(values, 99):>9.1f} {test.errors[step]:>7}")
+
+    print("\nВызовы Bot API:")
+    for method, count in session.calls.most_common():
+        print(f"  {method:<24} {count:>7}")
+
+    print("\nСамые затратные обработчики (TimingMiddleware):")
+    for h in metrics.get_handler_stats()[:10]:
+        print(f"  {h['name']:<32} ×{h['count']:<6} ср {h['avg_ms']:.1f} мс, БД {h['db_avg_ms']:.1f} мс")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+import database as db
+import keyboards as kb
+from background import SEND_ATTEMPTS, send_bucket, is_unreachable_error, spawn
+from config import (
+    BROADCAST_WORKERS, BROADCAST_CHUNK, BROADCAST_PROGRESS_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+_running: Dict[int, asyncio.Task] = {}
+
+SENT, FAILED, UNREACHABLE = "sent", "failed", "unreachable"
+
+# ===== ОТПРАВКА =====
+async def send_one(bot: Bot, job: Dict, user_id: int) -> str:
+    for _ in range(SEND_ATTEMPTS):
+        await send_bucket.acquire()
+        try:
+            if job['photo']:
+                await bot.send_photo(user_id, job['photo'], caption=job['text'] or "")
+            else:
+                await bot.send_message(user_id, job['text'])
+            return SENT
+        except TelegramRetryAfter as e:
+            # Флуд-контроль касается всего бота: притормаживаем всех отправителей
+            logger.warning("Рассылка #%s: retry_after %s с", job['id'], e.retry_after)
+            send_bucket.pause(e.retry_after)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Рассылка #%s: %s не доставлено: %s", job['id'], user_id, e)
+            return UNREACHABLE if is_unreachable_error(e) else FAILED
+    return FAILED
+
+async def send_chunk(bot: Bot, job: Dict, user_ids: List[int]) -> int:
+    """Рассылает кусок пулом из BROADCAST_WORKERS отправителей, возвращает число доставленных.
+    Заблокировавшие бота помечаются недоступными и в следующие рассылки не попадут"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for user_id in user_ids:
+        queue.put_nowait(user_id)
+    delivered = 0
+    unreachable: List[int] = []
+
+    async def worker() -> None:
+        nonlocal delivered
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            result = await send_one(bot, job, user_id)
+            if result == SENT:
+                delivered += 1
+            elif result == UNREACHABLE:
+                unreachable.append(user_id)
+
+    await asyncio.gather(*[worker() for _ in range(min(BROADCAST_WORKERS, len(user_ids)))])
+    await db.mark_users_unreachable(unreachable)
+    return delivered
+
+# ===== ПРОГРЕСС =====
+def progress_text(job: Dict, sent: int, failed: int, finished: bool = False) -> str:
+    if finished:
+        return (
+            f"✅ <b>Рассылка завершена!</b>\n\n"
+            f"✅ Доставлено: {sent}\n"
+            f"❌ Не доставлено: {failed}"
+        )
+    return (
+        f"📤 <b>Рассылка #{job['id']}</b>\n\n"
+        f"Обработано: {sent + failed} из ~{job['total']}\n"
+        f"✅ Доставлено: {sent}\n"
+        f"❌ Не доставлено: {failed}"
+    )
+
+async def show_progress(bot: Bot, job: Dict, sent: int, failed: int, finished: bool = False) -> None:
+    markup = kb.get_back_button("admin_panel") if finished else kb.get_broadcast_progress(job['id'])
+    try:
+        await bot.edit_message_text(
+            progress_text(job, sent, failed, finished),
+            chat_id=job['chat_id'],
+            message_id=job['message_id'],
+            reply_markup=markup,
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        # Текст не изменился или сообщение удалено — рассылка продолжается
+        logger.debug("Прогресс рассылки #%s не обновлён: %s", job['id'], e)
+
+# ===== ЗАДАНИЯ =====
+async def run_job(bot: Bot, job: Dict) -> None:
+    sent, failed, cursor = job['sent'], job['failed'], job['cursor']
+    last_shown = time.monotonic()
+    chunk: List[int] = []
+
+    async def flush() -> None:
+        nonlocal sent, failed, cursor, last_shown, chunk
+        delivered = await send_chunk(bot, job, chunk)
+        sent += delivered
+        failed += len(chunk) - delivered
+        cursor = chunk[-1]
+        chunk = []
+        # После перезапуска рассылка продолжится с этого id
+        await db.save_broadcast_progress(job['id'], cursor, sent, failed)
+        if time.monotonic() - last_shown >= BROADCAST_PROGRESS_INTERVAL:
+            last_shown = time.monotonic()
+            await show_progress(bot, job, sent, failed)
+
+    async for user_id in db.iter_user_ids(job['user_filter'], BROADCAST_CHUNK, after=cursor):
+        chunk.append(user_id)
+        if len(chunk) >= BROADCAST_CHUNK:
+            await flush()
+    if chunk:
+        await flush()
+
+    await db.finish_broadcast_job(job['id'])
+    await show_progress(bot, job, sent, failed, finished=True)
+    logger.info("Рассылка #%s завершена: %s доставлено, %s нет", job['id'], sent, failed)
+
+async def guarded_run(bot: Bot, job: Dict) -> None:
+    try:
+        await run_job(bot, job)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Задание остаётся running и продолжится после перезапуска
+        logger.exception("Рассылка #%s прервана ошибкой", job['id'])
+
+def start_job(bot: Bot, job: Dict) -> None:
+    task = spawn(guarded_run(bot, job), f"broadcast_{job['id']}")
+    _running[job['id']] = task
+    task.add_done_callback(lambda _: _running.pop(job['id'], None))
+
+async def cancel_job(job_id: int) -> bool:
+    """Останавливает идущую рассылку; False, если она уже завершена или не найдена"""
+    if not await db.finish_broadcast_job(job_id, "cancelled"):
+        return False
+    task = _running.pop(job_id, None)
+    if task is not None:
+        task.cancel()
+    return True
+
+async def resume_jobs(bot: Bot) -> None:
+    """Продолжает рассылки, прерванные перезапуском"""
+    for job in await db.get_running_broadcast_jobs():
+        logger.info("Продолжаю рассылку #%s с user_id > %s", job['id'], job['cursor'])
+        start_job(bot, job)
@@ -8,6 +8,67 @@ MAIN_ADMIN_ID = 1540438116  # Ваш Telegram ID
 # Ссылка на канал
 TELEGRAM_CHANNEL = "https://t.me/oxidefreecoin"
 
+# ==================== ЗАПУСК ====================
+BOT_MODE = os.getenv("BOT_MODE", "polling")     # polling или webhook
+# Вебхук: Telegram сам присылает обновления на WEBHOOK_BASE_URL + WEBHOOK_PATH
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # https://... (пусто — вебхук не регистрируется)
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")      # Сверяется с X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", 8080))
+
+# ==================== БАЗА ДАННЫХ ====================
+DATABASE_PATH = "oxide_bot.db"
+DB_POOL_SIZE = 4                # Соединений в пуле
+DB_POOL_TIMEOUT = 10            # Сколько ждать свободное соединение (сек)
+DB_SLOW_ACQUIRE_MS = 100        # Логировать ожидание соединения дольше (мс)
+DB_PROFILING = True             # Считать время функций database.py и SQL-запросов (/db_stats)
+DB_SLOW_QUERY_MS = 50           # Логировать запросы дольше (мс) вместе с EXPLAIN QUERY PLAN
+
+# Профиль SQLite: применяется к каждому соединению пула
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",      # Читатели не блокируют писателя
+    "synchronous": "NORMAL",    # fsync только на чекпоинте WAL
+    "busy_timeout": 5000,       # Ждать блокировку до 5 сек (мс)
+    "cache_size": -65536,       # Кэш страниц 64 МБ (отрицательное = КиБ)
+    "mmap_size": 268435456,     # 256 МБ отображения файла в память
+    "temp_store": "MEMORY",
+    "foreign_keys": "OFF",
+}
+WAL_CHECKPOINT_INTERVAL = 300   # Периодический чекпоинт WAL (сек)
+
+# Групповой коммит леджера (update_balance / debit_if_sufficient)
+LEDGER_FLUSH_INTERVAL_MS = 20   # Не дольше этого ждать перед коммитом пачки
+LEDGER_BATCH_SIZE = 200         # Коммитить сразу при таком размере пачки
+
+# Архив леджера: транзакции старше TRANSACTIONS_HOT_DAYS уходят в отдельную БД
+ARCHIVE_DATABASE_PATH = "oxide_archive.db"
+TRANSACTIONS_HOT_DAYS = 30      # Сколько дней истории держать в основной БД
+ARCHIVE_INTERVAL = 3600         # Как часто запускать архивацию (сек)
+ARCHIVE_BATCH = 5000            # Строк за одну транзакцию переноса
+
+# Кэш строк users в памяти (get_user)
+USER_CACHE_SIZE = 10000         # Максимум пользователей в кэше
+USER_CACHE_TTL = 300            # Время жизни записи (сек)
+PROFILES_CACHE_TTL = 30         # Кэш первой страницы анкет игроков и кланов (сек)
+
+# Чистильщик анкет
+PROFILE_SWEEP_INTERVAL = 600    # Как часто удалять просроченные анкеты (сек)
+PROFILE_SWEEP_BATCH = 500       # Строк за одну транзакцию удаления
+PROFILE_EXPIRY_NOTIFY_HOURS = 24  # Напоминать об истечении анкеты за N часов (0 — выключено)
+
+# Рассылки и уведомления
+SEND_RATE = 28                  # Сообщений в секунду на бота: рассылки и уведомления вместе (лимит Telegram ~30)
+BROADCAST_WORKERS = 8           # Параллельных отправителей
+BROADCAST_CHUNK = 100           # Получателей между сохранениями прогресса (повтор после сбоя — не больше куска)
+BROADCAST_PROGRESS_INTERVAL = 5  # Как часто обновлять сообщение с прогрессом (сек)
+
+# Состояния FSM в SQLite
+FSM_FLUSH_INTERVAL = 1.0        # Как часто сбрасывать накопленные изменения в БД (сек)
+FSM_STATE_TTL = 7 * 24 * 3600   # Незаконченный диалог удаляется через N секунд без изменений
+FSM_MEMORY_TTL = 600            # Сколько держать в памяти состояние, к которому не обращались (сек)
+FSM_EXPIRE_INTERVAL = 3600      # Как часто удалять устаревшие состояния (сек)
+
 # ==================== ЭКОНОМИКА ====================
 MIN_BET = 10                    # Минимальная ставка
 DEMO_BALANCE = 1000             # Начальный демо-баланс (серебро)
@@ -19,6 +80,17 @@ CLAN_PROFILE_COST = 170         # Анкета клана (2 недели)
 
 # ==================== ИГРЫ ====================
 WIN_CHANCE = 0.08  # 8% шанс выигрыша
+DICE_ANIMATION_DELAY = 4        # Результат броска приходит после анимации кубика (сек)
+ROULETTE_SPIN_DELAY = 2         # Результат рулетки — после «Крутим рулетку...» (сек)
+
+# Названия игр для истории операций и статистики (ключ хранится в bets.game)
+GAME_NAMES = {
+    "cube": "кубик",
+    "basketball": "баскетбол",
+    "darts": "дартс",
+    "roulette": "рулетка",
+    "minesweeper": "сапёр",
+}
 
 # Множители рулетки и их шансы
 ROULETTE_MULTIPLIERS = {
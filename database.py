@@ -1,14 +1,578 @@
 import aiosqlite
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
-from config import MAIN_ADMIN_ID, DEMO_BALANCE, PRIVILEGES
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, AsyncIterator
+from config import (
+    MAIN_ADMIN_ID, DEMO_BALANCE, PRIVILEGES, DATABASE_PATH,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_SLOW_ACQUIRE_MS, DB_PROFILING, DB_SLOW_QUERY_MS, SQLITE_PRAGMAS,
+    LEDGER_FLUSH_INTERVAL_MS, LEDGER_BATCH_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL,
+    PROFILES_CACHE_TTL, ARCHIVE_DATABASE_PATH, GAME_NAMES
+)
 import random
 import string
-
-DATABASE_PATH = "oxide_bot.db"
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===== ПУЛ СОЕДИНЕНИЙ =====
+async def apply_pragmas(conn: aiosqlite.Connection, pragmas: Dict = None) -> None:
+    """Применяет профиль производительности SQLite к соединению"""
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        await conn.execute(f"PRAGMA {name} = {value}")
+
+class ConnectionPool:
+    """Пул долгоживущих соединений aiosqlite (по потоку на соединение)"""
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._connections: List[aiosqlite.Connection] = []
+        self.stats = {
+            "acquires": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "hold_total": 0.0,
+            "hold_max": 0.0,
+            "timeouts": 0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self._connections)
+
+    async def open(self) -> None:
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path)
+            await apply_pragmas(conn)
+            self._connections.append(conn)
+            self._queue.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+        self._queue = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self._queue.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        acquired = time.perf_counter()
+        wait = acquired - started
+        if wait * 1000 > DB_SLOW_ACQUIRE_MS:
+            logger.warning("Ожидание соединения с БД: %.1f мс", wait * 1000)
+        try:
+            yield conn
+        finally:
+            # Незакоммиченное не должно утечь к следующему владельцу
+            if conn.in_transaction:
+                await conn.rollback()
+            conn.row_factory = None
+            self._queue.put_nowait(conn)
+            hold = time.perf_counter() - acquired
+            # Ожидание соединения — тоже время обработчика, потраченное на БД
+            metrics.add_time("db", wait + hold)
+            self.stats["acquires"] += 1
+            self.stats["wait_total"] += wait
+            self.stats["wait_max"] = max(self.stats["wait_max"], wait)
+            self.stats["hold_total"] += hold
+            self.stats["hold_max"] = max(self.stats["hold_max"], hold)
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = asyncio.Lock()
+
+async def open_pool() -> ConnectionPool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None or not _pool.is_open:
+            _pool = ConnectionPool(DATABASE_PATH)
+            await _pool.open()
+    return _pool
+
+@asynccontextmanager
+async def acquire():
+    """Соединение из общего пула (пул открывается при первом обращении)"""
+    pool = _pool if _pool is not None and _pool.is_open else await open_pool()
+    async with pool.acquire() as conn:
+        if not DB_PROFILING:
+            yield conn
+            return
+        timed = _TimedConnection(conn)
+        try:
+            yield timed
+        finally:
+            await timed.finish()
+
+async def close_db() -> None:
+    global _pool, _ledger
+    if _ledger is not None:
+        await _ledger.stop()
+        _ledger = None
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+# ===== ПРОФИЛИРОВАНИЕ ЗАПРОСОВ =====
+# Запросы, которые стоит разбирать через EXPLAIN QUERY PLAN
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+class _TimedCursor:
+    """Курсор, который досчитывает время выборки и число строк к своему запросу"""
+
+    def __init__(self, cursor: aiosqlite.Cursor, statement: list):
+        self._cursor = cursor
+        self._statement = statement
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    async def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = await fetch(*args)
+        self._statement[2] += time.perf_counter() - started
+        if isinstance(result, list):
+            self._statement[3] += len(result)
+        elif result is not None:
+            self._statement[3] += 1
+        return result
+
+    async def fetchone(self):
+        return await self._timed_fetch(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await self._timed_fetch(self._cursor.fetchall)
+
+    async def fetchmany(self, size: Optional[int] = None):
+        return await self._timed_fetch(self._cursor.fetchmany, size)
+
+class _TimedConnection:
+    """Обёртка соединения: время и строки каждого запроса уходят в metrics.
+    Запрос учитывается целиком (выполнение + выборка), когда начат следующий или соединение возвращено"""
+
+    def __init__(self, conn: aiosqlite.Connection):
+        object.__setattr__(self, "_conn", conn)
+        # [sql, params, секунды, строк из выборки, курсор]
+        object.__setattr__(self, "_statement", None)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        # row_factory и прочее — настройки самого соединения
+        setattr(self._conn, name, value)
+
+    async def execute(self, sql: str, parameters=None):
+        await self.finish()
+        started = time.perf_counter()
+        cursor = await self._conn.execute(sql, parameters)
+        statement = [sql, parameters, time.perf_counter() - started, 0, cursor]
+        object.__setattr__(self, "_statement", statement)
+        return _TimedCursor(cursor, statement)
+
+    async def executemany(self, sql: str, parameters):
+        await self.finish()
+        started = time.perf_counter()
+        cursor = await self._conn.executemany(sql, parameters)
+        metrics.record_statement(" ".join(sql.split()), time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor
+
+    async def commit(self) -> None:
+        await self.finish()
+        started = time.perf_counter()
+        await self._conn.commit()
+        metrics.record_statement("COMMIT", time.perf_counter() - started, 0)
+
+    async def finish(self) -> None:
+        statement = self._statement
+        if statement is None:
+            return
+        object.__setattr__(self, "_statement", None)
+        sql, parameters, elapsed, fetched, cursor = statement
+        rows = fetched or max(cursor.rowcount, 0)
+        normalized = " ".join(sql.split())
+        metrics.record_statement(normalized, elapsed, rows)
+        if elapsed * 1000 > DB_SLOW_QUERY_MS:
+            await self._log_slow(normalized, parameters, elapsed, rows)
+
+    async def _log_slow(self, sql: str, parameters, elapsed: float, rows: int) -> None:
+        plan = ""
+        if sql.upper().startswith(EXPLAINABLE):
+            try:
+                cursor = await self._conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+                plan = "\n".join(f"  {row[3]}" for row in await cursor.fetchall())
+            except Exception as e:
+                plan = f"  (план недоступен: {e})"
+        logger.warning("Медленный запрос: %.1f мс, строк %s\n%s\n%s", elapsed * 1000, rows, sql[:500], plan)
+
+async def checkpoint_wal(mode: str = "PASSIVE") -> tuple:
+    """Переносит WAL в основной файл, возвращает (busy, log, checkpointed)"""
+    async with acquire() as db:
+        cursor = await db.execute(f"PRAGMA wal_checkpoint({mode})")
+        return tuple(await cursor.fetchone())
+
+def get_pool_stats() -> Dict:
+    if _pool is None:
+        return {}
+    stats = dict(_pool.stats)
+    acquires = stats["acquires"] or 1
+    stats["size"] = _pool.size
+    stats["free"] = _pool._queue.qsize()
+    stats["wait_avg"] = stats["wait_total"] / acquires
+    stats["hold_avg"] = stats["hold_total"] / acquires
+    return stats
+
+# ===== КЭШ ПОЛЬЗОВАТЕЛЕЙ =====
+class UserCache:
+    """LRU-кэш строк users с TTL. Любая запись в users обязана вызвать invalidate"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()
+        # Растёт при каждой инвалидации: чтение, начатое до записи, не положит в кэш старую строку
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        entry = self._data.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        row, expires = entry
+        if expires < time.monotonic():
+            del self._data[user_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return dict(row)
+
+    def put(self, user_id: int, row: Dict, generation: int) -> None:
+        if generation != self.generation:
+            return
+        self._data[user_id] = (dict(row), time.monotonic() + self.ttl)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *user_ids: int) -> None:
+        self.generation += 1
+        for user_id in user_ids:
+            self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._data.clear()
+
+_user_cache = UserCache()
+
+def get_user_cache_stats() -> Dict:
+    total = _user_cache.hits + _user_cache.misses
+    return {
+        "size": len(_user_cache._data),
+        "max_size": _user_cache.max_size,
+        "hits": _user_cache.hits,
+        "misses": _user_cache.misses,
+        "evictions": _user_cache.evictions,
+        "hit_rate": _user_cache.hits / total if total else 0.0,
+    }
+
+# ===== ЛИДЕРБОРД =====
+class Leaderboard:
+    """Отсортированный в памяти рейтинг по total_earned: топ и место за O(log n)"""
+
+    def __init__(self):
+        self._scores: Dict[int, int] = {}
+        # (-score, user_id): по возрастанию = по убыванию заработка
+        self._order: List[tuple] = []
+
+    def load(self, rows: List[tuple]) -> None:
+        self._scores = {user_id: score for user_id, score in rows if score > 0}
+        self._order = sorted((-score, user_id) for user_id, score in self._scores.items())
+
+    def add(self, user_id: int, amount: int) -> None:
+        if amount <= 0:
+            return
+        old = self._scores.get(user_id, 0)
+        if old:
+            del self._order[bisect.bisect_left(self._order, (-old, user_id))]
+        self._scores[user_id] = old + amount
+        bisect.insort(self._order, (-(old + amount), user_id))
+
+    def top(self, limit: int) -> List[tuple]:
+        return [(user_id, -score) for score, user_id in self._order[:limit]]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место с учётом равенства очков или None, если пользователь ещё ничего не заработал"""
+        score = self._scores.get(user_id)
+        if not score:
+            return None
+        return bisect.bisect_left(self._order, (-score,)) + 1
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def clear(self) -> None:
+        self._scores.clear()
+        self._order.clear()
+
+_leaderboard = Leaderboard()
+
+async def _load_leaderboard(db: aiosqlite.Connection) -> None:
+    cursor = await db.execute('SELECT user_id, total_earned FROM users WHERE total_earned > 0')
+    _leaderboard.load(await cursor.fetchall())
+
+# ===== ЛЕДЖЕР (ГРУППОВОЙ КОММИТ) =====
+DURABILITY_SYNC = "sync"      # Сбросить пачку сразу и дождаться коммита
+DURABILITY_BATCH = "batch"    # Дождаться ближайшего группового коммита
+DURABILITY_ASYNC = "async"    # Поставить в очередь и не ждать
+
+class LedgerWriter:
+    """Копит изменения балансов и пишет их пачкой: один коммит на N мс или M строк"""
+
+    def __init__(self, interval_ms: int = LEDGER_FLUSH_INTERVAL_MS,
+                 max_rows: int = LEDGER_BATCH_SIZE):
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        self._pending: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            "batches": 0,
+            "rows": 0,
+            "batch_max": 0,
+            "flush_total": 0.0,
+            "flush_max": 0.0,
+            "errors": 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="ledger_writer")
+
+    async def stop(self) -> None:
+        # Не отменяем задачу: отмена посреди _write откатит пачку, уже вынутую из _pending,
+        # и её future никогда не завершатся. Дожидаемся текущего сброса и выходим из цикла
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def submit(self, kind: str, user_id: int, amount: int, description: str,
+               is_demo: bool, bet: Optional[tuple] = None) -> asyncio.Future:
+        """Для kind bet: bet = (игра, выигрыш), для kind payout: bet = (id ставки,)"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((kind, user_id, amount, description, is_demo, bet, future))
+        # Первая операция будит простаивающий цикл, полная пачка — сбрасывается сразу
+        if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+        return future
+
+    async def _run(self) -> None:
+        metrics.detach()
+        while not self._stopping:
+            if not self._pending:
+                # Без операций не просыпаемся по таймеру: ждём submit или stop
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            # Первая операция пришла — копим пачку не дольше interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            
+            started = time.perf_counter()
+            try:
+                results = await self._write(batch)
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Не удалось записать пачку леджера (%s строк), пишу по одной", len(batch))
+                results = await self._write_each(batch)
+            
+            for (*_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            
+            elapsed = time.perf_counter() - started
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(batch)
+            self.stats["batch_max"] = max(self.stats["batch_max"], len(batch))
+            self.stats["flush_total"] += elapsed
+            self.stats["flush_max"] = max(self.stats["flush_max"], elapsed)
+
+    async def _write_each(self, batch: List[tuple]) -> List[Any]:
+        """Пачка откатилась целиком — повторяем операции по одной, чтобы ошибка досталась только виновной"""
+        results = []
+        for item in batch:
+            try:
+                results.extend(await self._write([item]))
+            except Exception as e:
+                logger.exception("Операция леджера %s для %s не записана", item[0], item[1])
+                results.append(e)
+        return results
+
+    async def _write(self, batch: List[tuple]) -> List[Optional[int]]:
+        results = []
+        ledger_rows = []
+        # Сколько зачислить в рейтинг после коммита: (user_id, сумма)
+        earned = []
+        async with acquire() as db:
+            # Порядок операций сохраняется: списание видит все зачисления перед ним
+            for kind, user_id, amount, description, is_demo, bet, _ in batch:
+                field = "demo_balance" if is_demo else "balance"
+                tx_type = "demo" if is_demo else "real"
+                
+                if kind == "debit":
+                    cursor = await db.execute(f'''
+                        UPDATE users SET {field} = {field} - ?
+                        WHERE user_id = ? AND {field} >= ?
+                        RETURNING {field}
+                    ''', (amount, user_id, amount))
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        results.append(None)
+                        continue
+                    results.append(rows[0][0])
+                    ledger_rows.append((user_id, -amount, tx_type, description))
+                elif kind == "bet":
+                    # Ставка и выигрыш одним изменением баланса, если хватает на ставку.
+                    # Выигрыш идёт в total_earned, как зачисление через update_balance
+                    game, payout = bet
+                    cursor = await db.execute(f'''
+                        UPDATE users SET {field} = {field} + ?, total_earned = total_earned + ?
+                        WHERE user_id = ? AND {field} >= ?
+                        RETURNING {field}
+                    ''', (payout - amount, 0 if is_demo else payout, user_id, amount))
+                    if not await cursor.fetchall():
+                        results.append(None)
+                        continue
+                    cursor = await db.execute(
+                        "INSERT INTO bets (user_id, game, stake, payout, is_demo) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, game, amount, payout, is_demo)
+                    )
+                    results.append(cursor.lastrowid)
+                    ledger_rows.append((user_id, payout - amount, tx_type, description))
+                    if not is_demo:
+                        earned.append((user_id, payout))
+                elif kind == "payout":
+                    # Выигрыш по ставке, сыгранной в два этапа; выплачивается один раз
+                    (bet_id,) = bet
+                    cursor = await db.execute('''
+                        UPDATE bets SET payout = ? WHERE id = ? AND user_id = ? AND payout = 0
+                    ''', (amount, bet_id, user_id))
+                    if not cursor.rowcount:
+                        results.append(None)
+                        continue
+                    await db.execute(f'''
+                        UPDATE users SET {field} = {field} + ?, total_earned = total_earned + ?
+                        WHERE user_id = ?
+                    ''', (amount, 0 if is_demo else amount, user_id))
+                    results.append(bet_id)
+                    ledger_rows.append((user_id, amount, tx_type, description))
+                    if not is_demo:
+                        earned.append((user_id, amount))
+                else:
+                    if is_demo:
+                        await db.execute(
+                            'UPDATE users SET demo_balance = demo_balance + ? WHERE user_id = ?',
+                            (amount, user_id)
+                        )
+                    else:
+                        await db.execute('''
+                            UPDATE users SET balance = balance + ?, total_earned = total_earned + ?
+                            WHERE user_id = ?
+                        ''', (amount, max(amount, 0), user_id))
+                        earned.append((user_id, amount))
+                    results.append(None)
+                    ledger_rows.append((user_id, amount, tx_type, description))
+            
+            await db.executemany('''
+                INSERT INTO transactions (user_id, amount, type, description)
+                VALUES (?, ?, ?, ?)
+            ''', ledger_rows)
+            await db.commit()
+        _user_cache.invalidate(*{item[1] for item in batch})
+        for user_id, amount in earned:
+            _leaderboard.add(user_id, amount)
+        return results
+
+_ledger: Optional[LedgerWriter] = None
+
+def get_ledger() -> LedgerWriter:
+    global _ledger
+    if _ledger is None:
+        _ledger = LedgerWriter()
+    if not _ledger.is_running:
+        _ledger.start()
+    return _ledger
+
+async def _ledger_submit(kind: str, user_id: int, amount: int, description: str,
+                         is_demo: bool, durability: str, bet: Optional[tuple] = None):
+    ledger = get_ledger()
+    future = ledger.submit(kind, user_id, amount, description, is_demo, bet)
+    if durability == DURABILITY_ASYNC:
+        # Ошибку уже залогировал flush — не даём asyncio ругаться на неполученное исключение
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return None
+    if durability == DURABILITY_SYNC:
+        await ledger.flush()
+    # Коммит делает задача леджера: ожидание засчитываем обработчику как время БД
+    started = time.perf_counter()
+    try:
+        return await future
+    finally:
+        metrics.add_time("db", time.perf_counter() - started)
+
+def get_ledger_stats() -> Dict:
+    if _ledger is None:
+        return {}
+    stats = dict(_ledger.stats)
+    batches = stats["batches"] or 1
+    stats["pending"] = len(_ledger._pending)
+    stats["batch_avg"] = stats["rows"] / batches
+    stats["flush_avg"] = stats["flush_total"] / batches
+    return stats
 
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    await open_pool()
+    async with acquire() as db:
         # Пользователи
         await db.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -263,26 +827,414 @@ async def init_db():
         ''')
         
         await db.commit()
+        
+        await run_migrations(db)
+        await _load_admin_roster(db)
+        await _load_leaderboard(db)
+        await _detect_users_fts(db)
+    
+    get_ledger()
+
+# ===== СЧЁТЧИКИ СТАТИСТИКИ =====
+# Счётчик -> (таблица, выражение над строкой {r}, колонки для триггера UPDATE, версия схемы).
+# Триггеры прибавляют выражение для NEW и вычитают для OLD, поэтому get_stats читает одну таблицу.
+# Версия — миграция, в которой счётчик появился: старые миграции не трогают ещё не созданные колонки
+STATS_COUNTERS = {
+    "total_users": ("users", "1", (), 2),
+    "registered_users": ("users", "{r}.is_registered = TRUE", ("is_registered",), 2),
+    "total_balance": ("users", "{r}.balance", ("balance",), 2),
+    "active_game_tasks": ("game_tasks", "{r}.status = 'active'", ("status",), 2),
+    "active_card_tasks": ("card_tasks", "{r}.status = 'active'", ("status",), 2),
+    "pending_submissions": ("completed_tasks", "{r}.status = 'pending'", ("status",), 2),
+    "total_completed": ("completed_tasks", "{r}.status = 'completed'", ("status",), 2),
+    "pending_withdrawals": ("withdraw_requests", "{r}.status = 'pending'", ("status",), 2),
+    "active_promos": ("promocodes", "{r}.is_active = TRUE", ("is_active",), 2),
+    "open_orders": ("game_orders", "{r}.status = 'open'", ("status",), 3),
+    "reachable_users": ("users", "{r}.reachable = TRUE", ("reachable",), 8),
+}
+
+def _stats_counters(version: Optional[int] = None) -> Dict[str, tuple]:
+    return {
+        name: counter for name, counter in STATS_COUNTERS.items()
+        if version is None or counter[3] <= version
+    }
+
+def _counter_expr(expr: str, row: str) -> str:
+    return f"COALESCE(({expr.format(r=row)}), 0)"
+
+async def _install_stats_triggers(db: aiosqlite.Connection, version: Optional[int] = None) -> None:
+    """Пересоздаёт триггеры счётчиков по STATS_COUNTERS (до версии схемы version)"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    tables: Dict[str, List[tuple]] = {}
+    for name, (table, expr, columns, _) in _stats_counters(version).items():
+        tables.setdefault(table, []).append((name, expr, columns))
+    
+    for table, counters in tables.items():
+        for event in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER IF EXISTS trg_stats_{table}_{event}")
+        
+        inserts = [
+            f"UPDATE stats_counters SET value = value + {_counter_expr(expr, 'NEW')} WHERE name = '{name}';"
+            for name, expr, _ in counters
+        ]
+        deletes = [
+            f"UPDATE stats_counters SET value = value - {_counter_expr(expr, 'OLD')} WHERE name = '{name}';"
+            for name, expr, _ in counters
+        ]
+        updates = [
+            f"UPDATE stats_counters SET value = value + {_counter_expr(expr, 'NEW')} "
+            f"- {_counter_expr(expr, 'OLD')} WHERE name = '{name}';"
+            for name, expr, columns in counters if columns
+        ]
+        watched = sorted({col for _, _, columns in counters for col in columns})
+        
+        await db.execute(f'''
+            CREATE TRIGGER trg_stats_{table}_insert AFTER INSERT ON {table}
+            BEGIN {" ".join(inserts)} END
+        ''')
+        await db.execute(f'''
+            CREATE TRIGGER trg_stats_{table}_delete AFTER DELETE ON {table}
+            BEGIN {" ".join(deletes)} END
+        ''')
+        if updates:
+            await db.execute(f'''
+                CREATE TRIGGER trg_stats_{table}_update AFTER UPDATE OF {", ".join(watched)} ON {table}
+                BEGIN {" ".join(updates)} END
+            ''')
+
+async def _rebuild_stats(db: aiosqlite.Connection, version: Optional[int] = None) -> None:
+    for name, (table, expr, _, _) in _stats_counters(version).items():
+        await db.execute(f'''
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT ?, COALESCE(SUM({_counter_expr(expr, table)}), 0) FROM {table}
+        ''', (name,))
+
+def _stats_steps(version: int) -> list:
+    """Шаги миграции: триггеры и пересчёт для счётчиков, существующих в этой версии схемы"""
+    async def install(db: aiosqlite.Connection) -> None:
+        await _install_stats_triggers(db, version)
+    
+    async def rebuild(db: aiosqlite.Connection) -> None:
+        await _rebuild_stats(db, version)
+    
+    return [install, rebuild]
+
+async def rebuild_stats() -> Dict:
+    """Полный пересчёт счётчиков из исходных таблиц"""
+    async with acquire() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        await _rebuild_stats(db)
+        await db.commit()
+    return await get_stats()
+
+# ===== ПОИСК ПОЛЬЗОВАТЕЛЕЙ (FTS5) =====
+_users_fts = False
+USERS_FTS_COLUMNS = ("username", "full_name", "game_nickname")
+SEARCH_CANDIDATES = 500
+
+async def _create_users_fts(db: aiosqlite.Connection) -> None:
+    """Триграммный индекс по именам пользователей; без FTS5 поиск остаётся на LIKE"""
+    columns = ", ".join(USERS_FTS_COLUMNS)
+    new_values = ", ".join(f"new.{col}" for col in USERS_FTS_COLUMNS)
+    old_values = ", ".join(f"old.{col}" for col in USERS_FTS_COLUMNS)
+    try:
+        await db.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                {columns}, content='users', content_rowid='user_id', tokenize='trigram'
+            )
+        ''')
+    except aiosqlite.OperationalError as e:
+        logger.warning("FTS5 с trigram недоступен (%s), поиск пользователей через LIKE", e)
+        return
+    
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, {columns}) VALUES (new.user_id, {new_values});
+        END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {columns}) VALUES ('delete', old.user_id, {old_values});
+        END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_update AFTER UPDATE OF {columns} ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {columns}) VALUES ('delete', old.user_id, {old_values});
+            INSERT INTO users_fts (rowid, {columns}) VALUES (new.user_id, {new_values});
+        END
+    ''')
+    await db.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+async def _detect_users_fts(db: aiosqlite.Connection) -> None:
+    global _users_fts
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+    _users_fts = await cursor.fetchone() is not None
+
+# ===== МИГРАЦИИ =====
+# Версия схемы хранится в PRAGMA user_version. Шаг миграции — SQL-строка
+# или async-функция (db) -> None. Новые миграции только добавляются в конец.
+MIGRATIONS = [
+    (1, [
+        # Дубли мешают уникальным индексам: оставляем одну запись
+        '''DELETE FROM promo_uses WHERE id NOT IN (
+               SELECT MIN(id) FROM promo_uses GROUP BY user_id, promo_id)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_promo_uses_user_promo ON promo_uses(user_id, promo_id)",
+        '''DELETE FROM market_purchases WHERE id NOT IN (
+               SELECT MIN(id) FROM market_purchases GROUP BY user_id, item_id)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_market_purchases_user_item ON market_purchases(user_id, item_id)",
+        '''UPDATE user_subscriptions SET is_active = FALSE
+           WHERE is_active = TRUE AND id NOT IN (
+               SELECT MAX(id) FROM user_subscriptions WHERE is_active = TRUE
+               GROUP BY user_id, channel_id)''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS ux_user_subscriptions_active
+           ON user_subscriptions(user_id, channel_id) WHERE is_active = TRUE''',
+        # Анкета одна на пользователя (create_*_profile удаляет старую)
+        '''DELETE FROM player_profiles WHERE id NOT IN (
+               SELECT MAX(id) FROM player_profiles GROUP BY user_id)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_player_profiles_user ON player_profiles(user_id)",
+        '''DELETE FROM clan_profiles WHERE id NOT IN (
+               SELECT MAX(id) FROM clan_profiles GROUP BY user_id)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_clan_profiles_user ON clan_profiles(user_id)",
+        
+        "CREATE INDEX IF NOT EXISTS idx_users_total_earned ON users(total_earned DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_game_tasks_status ON game_tasks(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_card_tasks_status ON card_tasks(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_tasks_user ON user_tasks(user_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_completed_tasks_status ON completed_tasks(status, submitted_at)",
+        '''CREATE INDEX IF NOT EXISTS idx_completed_tasks_user_task
+           ON completed_tasks(user_id, task_id, task_type)''',
+        "CREATE INDEX IF NOT EXISTS idx_completed_tasks_user ON completed_tasks(user_id, submitted_at)",
+        '''CREATE INDEX IF NOT EXISTS idx_withdraw_requests_pending
+           ON withdraw_requests(created_at) WHERE status = 'pending' ''',
+        "CREATE INDEX IF NOT EXISTS idx_withdraw_requests_user ON withdraw_requests(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_game_orders_status ON game_orders(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_game_orders_created ON game_orders(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_game_orders_creator ON game_orders(creator_id)",
+        "CREATE INDEX IF NOT EXISTS idx_game_orders_executor ON game_orders(executor_id)",
+        "CREATE INDEX IF NOT EXISTS idx_player_profiles_expires ON player_profiles(expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_clan_profiles_expires ON clan_profiles(expires_at)",
+    ]),
+    # Счётчики для get_stats
+    (2, _stats_steps(2)),
+    # Счётчик открытых заказов для keyset-пагинации
+    (3, _stats_steps(3)),
+    # Полнотекстовый поиск пользователей
+    (4, [
+        _create_users_fts,
+    ]),
+    # Очистка просроченных анкет и напоминания об истечении.
+    # now() в условии частичного индекса недопустим, поэтому живые анкеты держит короткими
+    # чистильщик, а частичный индекс покрывает только ещё не уведомлённые анкеты
+    (5, [
+        "ALTER TABLE player_profiles ADD COLUMN expiry_notified BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE clan_profiles ADD COLUMN expiry_notified BOOLEAN DEFAULT FALSE",
+        '''CREATE INDEX IF NOT EXISTS idx_player_profiles_notify
+           ON player_profiles(expires_at) WHERE expiry_notified = FALSE''',
+        '''CREATE INDEX IF NOT EXISTS idx_clan_profiles_notify
+           ON clan_profiles(expires_at) WHERE expiry_notified = FALSE''',
+        "CREATE INDEX IF NOT EXISTS idx_player_profiles_created ON player_profiles(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_clan_profiles_created ON clan_profiles(created_at)",
+    ]),
+    # Суммы по транзакциям, перенесённым в архив
+    (6, [
+        '''CREATE TABLE IF NOT EXISTS balance_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            archived_real INTEGER NOT NULL DEFAULT 0,
+            archived_demo INTEGER NOT NULL DEFAULT 0,
+            archived_count INTEGER NOT NULL DEFAULT 0,
+            archived_through_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at)",
+    ]),
+    # Задания рассылки: переживают перезапуск и продолжаются с cursor
+    (7, [
+        '''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER,
+            chat_id INTEGER,
+            message_id INTEGER,
+            text TEXT,
+            photo TEXT,
+            user_filter TEXT DEFAULT 'all',
+            status TEXT DEFAULT 'running',
+            cursor INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)",
+    ]),
+    # Недоступные получатели (заблокировали бота, удалили аккаунт)
+    (8, [
+        "ALTER TABLE users ADD COLUMN reachable BOOLEAN DEFAULT TRUE",
+        "ALTER TABLE users ADD COLUMN blocked_at TIMESTAMP",
+        *_stats_steps(8),
+    ]),
+    # Состояния FSM: переживают перезапуск (см. storage.SQLiteStorage)
+    (9, [
+        '''CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)",
+    ]),
+    # Суммы архива не восстанавливают баланс (см. АРХИВ ЛЕДЖЕРА), имя таблицы это отражает
+    (10, [
+        "ALTER TABLE balance_checkpoints RENAME TO archived_transaction_totals",
+    ]),
+    # Ставки в мини-играх: объём и RTP по играм без разбора описаний транзакций
+    (11, [
+        '''CREATE TABLE IF NOT EXISTS bets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            game TEXT,
+            stake INTEGER,
+            payout INTEGER DEFAULT 0,
+            is_demo BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_bets_created ON bets(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_bets_user ON bets(user_id, created_at)",
+    ]),
+]
+
+async def run_migrations(db: aiosqlite.Connection) -> int:
+    """Применяет миграции новее PRAGMA user_version, каждую в своей транзакции"""
+    cursor = await db.execute("PRAGMA user_version")
+    current = (await cursor.fetchone())[0]
+    
+    for version, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("Миграция %s не применена", version)
+            raise
+        
+        logger.info("Схема БД обновлена до версии %s", version)
+        current = version
+    
+    return current
+
+# ===== ПАГИНАЦИЯ =====
+# Курсор: направление ("a" — страница после строки, "b" — до неё), цифры created_at и id в hex.
+# Ключ (created_at, id) покрыт индексами (status, created_at), поэтому глубокая страница
+# стоит столько же, сколько первая
+def _encode_cursor(direction: str, row: Dict) -> str:
+    digits = "".join(ch for ch in str(row['created_at']) if ch.isdigit())
+    return f"{direction}{digits}.{row['id']:x}"
+
+def _decode_cursor(cursor: str) -> tuple:
+    direction, body = cursor[0], cursor[1:]
+    digits, row_id = body.split(".")
+    created_at = (f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} "
+                  f"{digits[8:10]}:{digits[10:12]}:{digits[12:14]}")
+    if len(digits) > 14:
+        created_at += "." + digits[14:]
+    return direction, created_at, int(row_id, 16)
+
+async def _keyset_page(db: aiosqlite.Connection, query: str, params: tuple, alias: str,
+                       cursor: Optional[str], per_page: int) -> tuple:
+    """Страница от курсора по (created_at DESC, id DESC).
+    Возвращает (rows, prev_cursor, next_cursor)"""
+    key = f"{alias}.created_at, {alias}.id"
+    
+    direction = None
+    if cursor:
+        try:
+            direction, created_at, row_id = _decode_cursor(cursor)
+        except (ValueError, IndexError):
+            direction = None
+    
+    if direction == "a":
+        sql = f"{query} AND ({key}) < (?, ?) ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT ?"
+        args = params + (created_at, row_id, per_page + 1)
+    elif direction == "b":
+        sql = f"{query} AND ({key}) > (?, ?) ORDER BY {alias}.created_at ASC, {alias}.id ASC LIMIT ?"
+        args = params + (created_at, row_id, per_page + 1)
+    else:
+        sql = f"{query} ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT ?"
+        args = params + (per_page + 1,)
+    
+    cursor_obj = await db.execute(sql, args)
+    rows = [dict(row) for row in await cursor_obj.fetchall()]
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    if direction == "b":
+        rows.reverse()
+        # Перед курсором осталось меньше страницы — показываем начало списка
+        if not has_more:
+            return await _keyset_page(db, query, params, alias, None, per_page)
+        has_prev, has_next = True, True
+    elif direction == "a":
+        # Строки после курсора пропали — возвращаемся к началу
+        if not rows:
+            return await _keyset_page(db, query, params, alias, None, per_page)
+        has_prev, has_next = True, has_more
+    else:
+        has_prev, has_next = False, has_more
+    
+    prev_cursor = _encode_cursor("b", rows[0]) if has_prev and rows else None
+    next_cursor = _encode_cursor("a", rows[-1]) if has_next and rows else None
+    return rows, prev_cursor, next_cursor
+
+async def _get_counter(db: aiosqlite.Connection, name: str) -> int:
+    cursor = await db.execute("SELECT value FROM stats_counters WHERE name = ?", (name,))
+    row = await cursor.fetchone()
+    return row[0] if row else 0
 
 # ===== ПОЛЬЗОВАТЕЛИ =====
 async def get_user(user_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    generation = _user_cache.generation
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
         row = await cursor.fetchone()
-        return dict(row) if row else None
+    if row is None:
+        return None
+    user = dict(row)
+    _user_cache.put(user_id, user, generation)
+    return user
 
 async def create_user(user_id: int, username: str, full_name: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             INSERT OR IGNORE INTO users (user_id, username, full_name, demo_balance)
             VALUES (?, ?, ?, ?)
         ''', (user_id, username, full_name, DEMO_BALANCE))
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def complete_registration(user_id: int, server: str, nickname: str, 
                                 avatar: str = None, description: str = None) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             UPDATE users SET 
                 game_server = ?, game_nickname = ?, avatar_file_id = ?,
@@ -290,42 +1242,55 @@ async def complete_registration(user_id: int, server: str, nickname: str,
             WHERE user_id = ?
         ''', (server, nickname, avatar, description, user_id))
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def update_balance(user_id: int, amount: int, description: str = "", 
-                         is_demo: bool = False) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        if is_demo:
-            await db.execute(
-                'UPDATE users SET demo_balance = demo_balance + ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-        else:
-            await db.execute(
-                'UPDATE users SET balance = balance + ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-            if amount > 0:
-                await db.execute(
-                    'UPDATE users SET total_earned = total_earned + ? WHERE user_id = ?',
-                    (amount, user_id)
-                )
-        
-        await db.execute('''
-            INSERT INTO transactions (user_id, amount, type, description)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, amount, "demo" if is_demo else "real", description))
-        await db.commit()
+                         is_demo: bool = False, durability: Optional[str] = None) -> None:
+    """Изменение баланса через групповой коммит.
+    По умолчанию демо-операции не ждут записи, реальные ждут ближайшего коммита"""
+    if durability is None:
+        durability = DURABILITY_ASYNC if is_demo else DURABILITY_BATCH
+    await _ledger_submit("credit", user_id, amount, description, is_demo, durability)
+
+async def debit_if_sufficient(user_id: int, amount: int, reason: str = "",
+                              is_demo: bool = False,
+                              durability: str = DURABILITY_BATCH) -> Optional[int]:
+    """Атомарно списывает amount, если хватает средств. Возвращает новый баланс или None"""
+    if durability == DURABILITY_ASYNC:
+        raise ValueError("Списанию нужен результат, async недоступен")
+    return await _ledger_submit("debit", user_id, amount, reason, is_demo, durability)
+
+async def settle_bet(user_id: int, game: str, stake: int, payout: int, is_demo: bool = False,
+                     durability: str = DURABILITY_BATCH) -> Optional[int]:
+    """Сыгранная ставка одной операцией: баланс меняется на payout - stake, если хватает на stake.
+    Пишет одну строку transactions и строку bets. Возвращает id ставки или None"""
+    if durability == DURABILITY_ASYNC:
+        raise ValueError("Ставке нужен результат, async недоступен")
+    return await _ledger_submit("bet", user_id, stake, f"Игра: {GAME_NAMES.get(game, game)}",
+                                is_demo, durability, (game, payout))
+
+async def pay_bet(bet_id: int, user_id: int, payout: int, is_demo: bool = False,
+                  durability: str = DURABILITY_BATCH) -> bool:
+    """Выигрыш по ставке из settle_bet(payout=0), если исход известен позже (сапёр).
+    Повторная выплата по той же ставке ничего не делает"""
+    if durability == DURABILITY_ASYNC:
+        raise ValueError("Выплате нужен результат, async недоступен")
+    paid = await _ledger_submit("payout", user_id, payout, f"Выигрыш: ставка #{bet_id}",
+                                is_demo, durability, (bet_id,))
+    return paid is not None
 
 async def set_user_balance(user_id: int, balance: int, is_demo: bool = False) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         field = "demo_balance" if is_demo else "balance"
         await db.execute(f'UPDATE users SET {field} = ? WHERE user_id = ?', (balance, user_id))
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def set_user_privilege(user_id: int, privilege: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('UPDATE users SET privilege = ? WHERE user_id = ?', (privilege, user_id))
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def update_user_privilege_by_days(user_id: int) -> str:
     """Автоматическое обновление привилегии по дням"""
@@ -353,56 +1318,88 @@ async def update_user_privilege_by_days(user_id: int) -> str:
     return new_privilege
 
 async def increment_completed_tasks(user_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             'UPDATE users SET tasks_completed = tasks_completed + 1 WHERE user_id = ?',
             (user_id,)
         )
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def get_top_users(limit: int = 10) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            'SELECT * FROM users ORDER BY total_earned DESC LIMIT ?', 
-            (limit,)
-        )
-        return [dict(row) for row in await cursor.fetchall()]
+    """Топ из рейтинга в памяти, профили через кэш пользователей"""
+    top = []
+    for user_id, score in _leaderboard.top(limit):
+        user = await get_user(user_id)
+        if user:
+            user['total_earned'] = score
+            top.append(user)
+    return top
+
+async def get_user_rank(user_id: int) -> tuple:
+    """Возвращает (место или None, число игроков в рейтинге)"""
+    return _leaderboard.rank(user_id), len(_leaderboard)
 
 async def reset_leaderboard() -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('UPDATE users SET total_earned = 0')
         await db.commit()
+        _user_cache.clear()
+        _leaderboard.clear()
 
-async def search_users(query: str) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def search_users(query: str, limit: int = 20) -> List[Dict]:
+    query = query.strip()
+    if not query:
+        return []
+    
+    # Точный ID — одна точечная выборка
+    if query.isdigit():
+        user = await get_user(int(query))
+        if user:
+            return [user]
+    
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
-        cursor = await db.execute('''
-            SELECT * FROM users 
-            WHERE username LIKE ? OR full_name LIKE ? OR user_id = ?
-            LIMIT 20
-        ''', (f'%{query}%', f'%{query}%', int(query) if query.isdigit() else 0))
+        # Триграммам нужно хотя бы 3 символа, короткие запросы ищем по-старому
+        if _users_fts and len(query) >= 3:
+            # Ранжируем не больше SEARCH_CANDIDATES совпадений: частая подстрока не сканирует весь индекс
+            cursor = await db.execute('''
+                SELECT u.* FROM (
+                    SELECT rowid, rank FROM users_fts WHERE users_fts MATCH ? LIMIT ?
+                ) AS f
+                JOIN users u ON u.user_id = f.rowid
+                ORDER BY f.rank
+                LIMIT ?
+            ''', ('"' + query.replace('"', '""') + '"', SEARCH_CANDIDATES, limit))
+        else:
+            cursor = await db.execute('''
+                SELECT * FROM users 
+                WHERE username LIKE ? OR full_name LIKE ? OR game_nickname LIKE ?
+                LIMIT ?
+            ''', (f'%{query}%', f'%{query}%', f'%{query}%', limit))
         return [dict(row) for row in await cursor.fetchall()]
 
 async def add_promo_ability(user_id: int, count: int = 1) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             'UPDATE users SET promo_ability = promo_ability + ? WHERE user_id = ?',
             (count, user_id)
         )
         await db.commit()
+        _user_cache.invalidate(user_id)
 
 async def use_promo_ability(user_id: int) -> bool:
     user = await get_user(user_id)
     if not user or user['promo_ability'] <= 0:
         return False
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             'UPDATE users SET promo_ability = promo_ability - 1 WHERE user_id = ?',
             (user_id,)
         )
         await db.commit()
+        _user_cache.invalidate(user_id)
     return True
 
 async def claim_daily_bonus(user_id: int) -> Optional[int]:
@@ -419,32 +1416,47 @@ async def claim_daily_bonus(user_id: int) -> Optional[int]:
     
     bonus = 1  # 1 монета в день
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             UPDATE users SET balance = balance + ?, last_daily_bonus = ?
             WHERE user_id = ?
         ''', (bonus, datetime.now(), user_id))
         await db.commit()
+        _user_cache.invalidate(user_id)
     
     return bonus
 
 # ===== АДМИНИСТРАТОРЫ =====
+# Копия таблицы admins в памяти: проверки прав идут без запросов к БД
+_admin_ids: set = set()
+_main_admin_ids: set = set()
+_admins_loaded = False
+
+async def _load_admin_roster(db: aiosqlite.Connection) -> None:
+    global _admin_ids, _main_admin_ids, _admins_loaded
+    cursor = await db.execute("SELECT user_id, is_main_admin FROM admins")
+    rows = await cursor.fetchall()
+    _admin_ids = {row[0] for row in rows}
+    _main_admin_ids = {row[0] for row in rows if row[1]}
+    _admins_loaded = True
+
+async def reload_admin_roster() -> None:
+    async with acquire() as db:
+        await _load_admin_roster(db)
+
 async def is_admin(user_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-        return await cursor.fetchone() is not None
+    if not _admins_loaded:
+        await reload_admin_roster()
+    return user_id in _admin_ids
 
 async def is_main_admin(user_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT 1 FROM admins WHERE user_id = ? AND is_main_admin = TRUE", 
-            (user_id,)
-        )
-        return await cursor.fetchone() is not None
+    if not _admins_loaded:
+        await reload_admin_roster()
+    return user_id in _main_admin_ids
 
 async def add_admin(user_id: int, username: str, clan_name: str, 
                     game_nick: str, server_name: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             INSERT OR REPLACE INTO admins (user_id, username, clan_name, game_nick, server_name)
             VALUES (?, ?, ?, ?, ?)
@@ -452,9 +1464,11 @@ async def add_admin(user_id: int, username: str, clan_name: str,
         # Также ставим привилегию админа
         await db.execute('UPDATE users SET privilege = ? WHERE user_id = ?', ('admin', user_id))
         await db.commit()
+        _user_cache.invalidate(user_id)
+        await _load_admin_roster(db)
 
 async def remove_admin(user_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute(
             "SELECT is_main_admin FROM admins WHERE user_id = ?", 
             (user_id,)
@@ -465,24 +1479,26 @@ async def remove_admin(user_id: int) -> bool:
         await db.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
         await db.execute("UPDATE users SET privilege = 'strong' WHERE user_id = ?", (user_id,))
         await db.commit()
+        _user_cache.invalidate(user_id)
+        await _load_admin_roster(db)
         return True
 
 async def get_admin(user_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("SELECT * FROM admins WHERE user_id = ?", (user_id,))
         row = await cursor.fetchone()
         return dict(row) if row else None
 
 async def get_all_admins() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("SELECT * FROM admins")
         return [dict(row) for row in await cursor.fetchall()]
 
 async def update_admin_profile(user_id: int, clan_name: str, 
                                game_nick: str, server_name: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             UPDATE admins SET clan_name = ?, game_nick = ?, server_name = ?
             WHERE user_id = ?
@@ -494,7 +1510,7 @@ async def create_game_task(admin_id: int, server_name: str, clan_name: str,
                            game_nick: str, resource_category: str, 
                            resource_type: str, resource_amount: int,
                            reward: int, description: str = "") -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO game_tasks 
             (admin_id, server_name, clan_name, game_nick, resource_category,
@@ -505,32 +1521,24 @@ async def create_game_task(admin_id: int, server_name: str, clan_name: str,
         await db.commit()
         return cursor.lastrowid
 
-async def get_active_game_tasks(page: int = 0, per_page: int = 5) -> tuple:
-    """Возвращает (tasks, total_count)"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def get_active_game_tasks(cursor: Optional[str] = None, per_page: int = 5) -> tuple:
+    """Возвращает (tasks, total_count, prev_cursor, next_cursor)"""
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         
-        # Общее количество
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM game_tasks WHERE status = 'active'"
-        )
-        total = (await cursor.fetchone())[0]
+        # Общее количество из счётчиков
+        total = await _get_counter(db, "active_game_tasks")
         
-        # Задания с пагинацией
-        cursor = await db.execute('''
+        tasks, prev_cursor, next_cursor = await _keyset_page(db, '''
             SELECT gt.*, a.clan_name as admin_clan, a.game_nick as admin_nick
             FROM game_tasks gt
             JOIN admins a ON gt.admin_id = a.user_id
             WHERE gt.status = 'active'
-            ORDER BY gt.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (per_page, page * per_page))
-        
-        tasks = [dict(row) for row in await cursor.fetchall()]
-        return tasks, total
+        ''', (), "gt", cursor, per_page)
+        return tasks, total, prev_cursor, next_cursor
 
 async def get_game_task(task_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT gt.*, a.clan_name as admin_clan, a.game_nick as admin_nick
@@ -542,7 +1550,7 @@ async def get_game_task(task_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def complete_game_task(task_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE game_tasks SET status = 'completed' WHERE id = ?", 
             (task_id,)
@@ -550,7 +1558,7 @@ async def complete_game_task(task_id: int) -> None:
         await db.commit()
 
 async def delete_game_task(task_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE game_tasks SET status = 'deleted' WHERE id = ?", 
             (task_id,)
@@ -560,7 +1568,7 @@ async def delete_game_task(task_id: int) -> None:
 # ===== ЗАДАНИЯ С КАРТАМИ =====
 async def create_card_task(admin_id: int, card_name: str, referral_link: str,
                            description: str, reward: int) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO card_tasks (admin_id, card_name, referral_link, description, reward)
             VALUES (?, ?, ?, ?, ?)
@@ -568,33 +1576,26 @@ async def create_card_task(admin_id: int, card_name: str, referral_link: str,
         await db.commit()
         return cursor.lastrowid
 
-async def get_active_card_tasks(page: int = 0, per_page: int = 5) -> tuple:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def get_active_card_tasks(cursor: Optional[str] = None, per_page: int = 5) -> tuple:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM card_tasks WHERE status = 'active'"
-        )
-        total = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute('''
-            SELECT * FROM card_tasks WHERE status = 'active'
-            ORDER BY created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (per_page, page * per_page))
+        total = await _get_counter(db, "active_card_tasks")
         
-        tasks = [dict(row) for row in await cursor.fetchall()]
-        return tasks, total
+        tasks, prev_cursor, next_cursor = await _keyset_page(
+            db, "SELECT * FROM card_tasks ct WHERE ct.status = 'active'", (), "ct", cursor, per_page
+        )
+        return tasks, total, prev_cursor, next_cursor
 
 async def get_card_task(task_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("SELECT * FROM card_tasks WHERE id = ?", (task_id,))
         row = await cursor.fetchone()
         return dict(row) if row else None
 
 async def complete_card_task(task_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE card_tasks SET status = 'completed' WHERE id = ?", 
             (task_id,)
@@ -604,7 +1605,7 @@ async def complete_card_task(task_id: int) -> None:
 # ===== ПОЛЬЗОВАТЕЛЬСКИЕ ЗАДАНИЯ =====
 async def create_user_task(user_id: int, task_type: str, item_type: str,
                            item_amount: int, price: int) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO user_tasks (user_id, task_type, item_type, item_amount, price_paid)
             VALUES (?, ?, ?, ?, ?)
@@ -613,7 +1614,7 @@ async def create_user_task(user_id: int, task_type: str, item_type: str,
         return cursor.lastrowid
 
 async def get_user_active_tasks_count(user_id: int) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             SELECT COUNT(*) FROM user_tasks 
             WHERE user_id = ? AND status = 'pending'
@@ -621,7 +1622,7 @@ async def get_user_active_tasks_count(user_id: int) -> int:
         return (await cursor.fetchone())[0]
 
 async def get_user_tasks(user_id: int) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM user_tasks WHERE user_id = ? ORDER BY created_at DESC
@@ -631,7 +1632,7 @@ async def get_user_tasks(user_id: int) -> List[Dict]:
 # ===== ВЫПОЛНЕННЫЕ ЗАДАНИЯ =====
 async def submit_task(user_id: int, task_id: int, task_type: str, 
                       proof_file_id: str) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO completed_tasks (user_id, task_id, task_type, proof_file_id)
             VALUES (?, ?, ?, ?)
@@ -640,7 +1641,7 @@ async def submit_task(user_id: int, task_id: int, task_type: str,
         return cursor.lastrowid
 
 async def get_pending_submissions() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT ct.*, u.username, u.full_name
@@ -652,7 +1653,7 @@ async def get_pending_submissions() -> List[Dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 async def get_submission(submission_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT ct.*, u.username, u.full_name
@@ -664,7 +1665,7 @@ async def get_submission(submission_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def approve_submission(submission_id: int, admin_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM completed_tasks WHERE id = ?", 
@@ -712,7 +1713,7 @@ async def approve_submission(submission_id: int, admin_id: int) -> Optional[Dict
 
 async def reject_submission(submission_id: int, admin_id: int, 
                             comment: str) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM completed_tasks WHERE id = ?", 
@@ -732,7 +1733,7 @@ async def reject_submission(submission_id: int, admin_id: int,
         return dict(submission)
 
 async def get_user_submissions(user_id: int, limit: int = 10) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM completed_tasks WHERE user_id = ?
@@ -742,7 +1743,7 @@ async def get_user_submissions(user_id: int, limit: int = 10) -> List[Dict]:
 
 async def has_user_submitted_task(user_id: int, task_id: int, 
                                    task_type: str) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             SELECT 1 FROM completed_tasks 
             WHERE user_id = ? AND task_id = ? AND task_type = ? 
@@ -753,7 +1754,7 @@ async def has_user_submitted_task(user_id: int, task_id: int,
 # ===== ЗАЯВКИ НА ВЫВОД =====
 async def create_withdraw_request(user_id: int, pack_id: str, 
                                    coins: int, game_id: str) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO withdraw_requests (user_id, pack_id, coins, game_id)
             VALUES (?, ?, ?, ?)
@@ -762,7 +1763,7 @@ async def create_withdraw_request(user_id: int, pack_id: str,
         return cursor.lastrowid
 
 async def get_pending_withdrawals() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT wr.*, u.username, u.full_name
@@ -774,7 +1775,7 @@ async def get_pending_withdrawals() -> List[Dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 async def get_withdrawal(withdraw_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT wr.*, u.username, u.full_name
@@ -786,7 +1787,7 @@ async def get_withdrawal(withdraw_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def complete_withdrawal(withdraw_id: int, admin_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM withdraw_requests WHERE id = ?", 
@@ -806,7 +1807,7 @@ async def complete_withdrawal(withdraw_id: int, admin_id: int) -> Optional[Dict]
 
 async def reject_withdrawal(withdraw_id: int, admin_id: int, 
                             reason: str) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM withdraw_requests WHERE id = ?", 
@@ -830,10 +1831,11 @@ async def reject_withdrawal(withdraw_id: int, admin_id: int,
             WHERE id = ?
         ''', (datetime.now(), admin_id, reason, withdraw_id))
         await db.commit()
+        _user_cache.invalidate(wd['user_id'])
         return wd
 
 async def get_user_withdrawals(user_id: int, limit: int = 5) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM withdraw_requests WHERE user_id = ?
@@ -844,7 +1846,7 @@ async def get_user_withdrawals(user_id: int, limit: int = 5) -> List[Dict]:
 # ===== ПРОМОКОДЫ =====
 async def create_promocode(code: str, coins: int, max_uses: int, 
                            created_by: int) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO promocodes (code, coins, max_uses, created_by)
             VALUES (?, ?, ?, ?)
@@ -853,7 +1855,7 @@ async def create_promocode(code: str, coins: int, max_uses: int,
         return cursor.lastrowid
 
 async def get_promocode(code: str) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM promocodes WHERE code = ? AND is_active = TRUE",
@@ -863,19 +1865,15 @@ async def get_promocode(code: str) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def use_promocode(user_id: int, promo_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Проверяем, не использовал ли уже
+    async with acquire() as db:
+        # Уникальный индекс (user_id, promo_id): повторная активация игнорируется
         cursor = await db.execute(
-            "SELECT 1 FROM promo_uses WHERE user_id = ? AND promo_id = ?",
+            "INSERT OR IGNORE INTO promo_uses (user_id, promo_id) VALUES (?, ?)",
             (user_id, promo_id)
         )
-        if await cursor.fetchone():
+        if cursor.rowcount == 0:
             return False
         
-        await db.execute(
-            "INSERT INTO promo_uses (user_id, promo_id) VALUES (?, ?)",
-            (user_id, promo_id)
-        )
         await db.execute(
             "UPDATE promocodes SET current_uses = current_uses + 1 WHERE id = ?",
             (promo_id,)
@@ -891,7 +1889,7 @@ async def use_promocode(user_id: int, promo_id: int) -> bool:
         return True
 
 async def get_all_promocodes() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM promocodes ORDER BY created_at DESC"
@@ -899,7 +1897,7 @@ async def get_all_promocodes() -> List[Dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 async def delete_promocode(promo_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE promocodes SET is_active = FALSE WHERE id = ?", 
             (promo_id,)
@@ -912,7 +1910,7 @@ def generate_promo_code(length: int = 8) -> str:
 # ===== РЫНОК =====
 async def create_market_item(name: str, price: int, description: str,
                              reward_type: str, reward_value: str) -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO market_items (name, price, description, reward_type, reward_value)
             VALUES (?, ?, ?, ?, ?)
@@ -921,7 +1919,7 @@ async def create_market_item(name: str, price: int, description: str,
         return cursor.lastrowid
 
 async def get_market_items() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM market_items WHERE is_active = TRUE"
@@ -929,7 +1927,7 @@ async def get_market_items() -> List[Dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 async def get_market_item(item_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM market_items WHERE id = ?", 
@@ -939,16 +1937,24 @@ async def get_market_item(item_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def purchase_market_item(user_id: int, item_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO market_purchases (user_id, item_id) VALUES (?, ?)",
+            (user_id, item_id)
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def cancel_market_purchase(user_id: int, item_id: int) -> None:
+    async with acquire() as db:
         await db.execute(
-            "INSERT INTO market_purchases (user_id, item_id) VALUES (?, ?)",
+            "DELETE FROM market_purchases WHERE user_id = ? AND item_id = ?",
             (user_id, item_id)
         )
         await db.commit()
-        return True
 
 async def has_purchased_item(user_id: int, item_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute(
             "SELECT 1 FROM market_purchases WHERE user_id = ? AND item_id = ?",
             (user_id, item_id)
@@ -956,7 +1962,7 @@ async def has_purchased_item(user_id: int, item_id: int) -> bool:
         return await cursor.fetchone() is not None
 
 async def delete_market_item(item_id: int) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE market_items SET is_active = FALSE WHERE id = ?",
             (item_id,)
@@ -964,10 +1970,33 @@ async def delete_market_item(item_id: int) -> None:
         await db.commit()
 
 # ===== АНКЕТЫ =====
+# Первая страница списков анкет: kind -> (monotonic-время истечения, limit, (profiles, total))
+_profiles_pages: Dict[str, tuple] = {}
+
+def _invalidate_profiles(kind: str) -> None:
+    _profiles_pages.pop(kind, None)
+
+async def _get_profiles_page(kind: str, query: str, count_query: str, limit: int) -> tuple:
+    cached = _profiles_pages.get(kind)
+    if cached and cached[0] > time.monotonic() and cached[1] >= limit:
+        profiles, total = cached[2]
+        return profiles[:limit], total
+
+    now = datetime.now()
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(query, (now, limit))
+        profiles = [dict(row) for row in await cursor.fetchall()]
+        cursor = await db.execute(count_query, (now,))
+        total = (await cursor.fetchone())[0]
+
+    _profiles_pages[kind] = (time.monotonic() + PROFILES_CACHE_TTL, limit, (profiles, total))
+    return profiles, total
+
 async def create_player_profile(user_id: int, age: int, hours: str, name: str,
                                 nickname: str, server: str, prev_clans: str) -> int:
     expires = datetime.now() + timedelta(days=7)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         # Удаляем старую анкету
         await db.execute(
             "DELETE FROM player_profiles WHERE user_id = ?", 
@@ -979,24 +2008,36 @@ async def create_player_profile(user_id: int, age: int, hours: str, name: str,
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, age, hours, name, nickname, server, prev_clans, expires))
         await db.commit()
+        _invalidate_profiles("player")
         return cursor.lastrowid
 
-async def get_active_player_profiles() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def get_player_profile(profile_id: int) -> Optional[Dict]:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT pp.*, u.username, u.full_name, u.avatar_file_id
             FROM player_profiles pp
             JOIN users u ON pp.user_id = u.user_id
-            WHERE pp.expires_at > ?
-            ORDER BY pp.created_at DESC
-        ''', (datetime.now(),))
-        return [dict(row) for row in await cursor.fetchall()]
+            WHERE pp.id = ? AND pp.expires_at > ?
+        ''', (profile_id, datetime.now()))
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+async def get_player_profiles_page(limit: int = 10) -> tuple:
+    """Свежие анкеты игроков для списка, возвращает (profiles, total)"""
+    return await _get_profiles_page("player", '''
+        SELECT pp.*, u.username, u.full_name, u.avatar_file_id
+        FROM player_profiles pp
+        JOIN users u ON pp.user_id = u.user_id
+        WHERE pp.expires_at > ?
+        ORDER BY pp.created_at DESC
+        LIMIT ?
+    ''', "SELECT COUNT(*) FROM player_profiles WHERE expires_at > ?", limit)
 
 async def create_clan_profile(user_id: int, name: str, tag: str, avatar: str,
                               founded: str, server: str, hours: int) -> int:
     expires = datetime.now() + timedelta(days=14)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "DELETE FROM clan_profiles WHERE user_id = ?", 
             (user_id,)
@@ -1008,71 +2049,110 @@ async def create_clan_profile(user_id: int, name: str, tag: str, avatar: str,
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, name, tag, avatar, founded, server, hours, expires))
         await db.commit()
+        _invalidate_profiles("clan")
         return cursor.lastrowid
 
-async def get_active_clan_profiles() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def get_clan_profile(profile_id: int) -> Optional[Dict]:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT cp.*, u.username, u.full_name
             FROM clan_profiles cp
             JOIN users u ON cp.user_id = u.user_id
-            WHERE cp.expires_at > ?
-            ORDER BY cp.created_at DESC
-        ''', (datetime.now(),))
-        return [dict(row) for row in await cursor.fetchall()]
+            WHERE cp.id = ? AND cp.expires_at > ?
+        ''', (profile_id, datetime.now()))
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+async def get_clan_profiles_page(limit: int = 10) -> tuple:
+    """Свежие анкеты кланов для списка, возвращает (profiles, total)"""
+    return await _get_profiles_page("clan", '''
+        SELECT cp.*, u.username, u.full_name
+        FROM clan_profiles cp
+        JOIN users u ON cp.user_id = u.user_id
+        WHERE cp.expires_at > ?
+        ORDER BY cp.created_at DESC
+        LIMIT ?
+    ''', "SELECT COUNT(*) FROM clan_profiles WHERE expires_at > ?", limit)
+
+PROFILE_TABLES = {"player": "player_profiles", "clan": "clan_profiles"}
+
+async def delete_expired_profiles(batch: int = 500) -> int:
+    """Удаляет просроченные анкеты пачками по batch строк, каждая пачка — своя транзакция"""
+    deleted = 0
+    now = datetime.now()
+    for kind, table in PROFILE_TABLES.items():
+        while True:
+            async with acquire() as db:
+                cursor = await db.execute(f'''
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT id FROM {table} WHERE expires_at <= ? LIMIT ?
+                    )
+                ''', (now, batch))
+                await db.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount:
+                _invalidate_profiles(kind)
+            if cursor.rowcount < batch:
+                break
+            # Даём поработать обработчикам между пачками
+            await asyncio.sleep(0)
+    return deleted
+
+async def claim_expiring_profiles(within: timedelta, limit: int = 100) -> List[Dict]:
+    """Анкеты, истекающие в ближайшее within, ещё без напоминания; сразу помечаются уведомлёнными"""
+    now = datetime.now()
+    claimed = []
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        for kind, table in PROFILE_TABLES.items():
+            cursor = await db.execute(f'''
+                UPDATE {table} SET expiry_notified = TRUE
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE expiry_notified = FALSE AND expires_at > ? AND expires_at <= ?
+                    LIMIT ?
+                )
+                RETURNING id, user_id, expires_at
+            ''', (now, now + within, limit))
+            claimed.extend(dict(row, kind=kind) for row in await cursor.fetchall())
+        await db.commit()
+    return claimed
 
 # ===== СТАТИСТИКА =====
 async def get_stats() -> Dict:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        stats = {}
-        
-        cursor = await db.execute("SELECT COUNT(*) FROM users")
-        stats['total_users'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute("SELECT COUNT(*) FROM users WHERE is_registered = TRUE")
-        stats['registered_users'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM game_tasks WHERE status = 'active'"
-        )
-        stats['active_game_tasks'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM card_tasks WHERE status = 'active'"
-        )
-        stats['active_card_tasks'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM completed_tasks WHERE status = 'pending'"
-        )
-        stats['pending_submissions'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM withdraw_requests WHERE status = 'pending'"
-        )
-        stats['pending_withdrawals'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM completed_tasks WHERE status = 'completed'"
-        )
-        stats['total_completed'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute("SELECT COALESCE(SUM(balance), 0) FROM users")
-        stats['total_balance'] = (await cursor.fetchone())[0]
-        
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM promocodes WHERE is_active = TRUE"
-        )
-        stats['active_promos'] = (await cursor.fetchone())[0]
-        
+    async with acquire() as db:
+        cursor = await db.execute("SELECT name, value FROM stats_counters")
+        stats = dict.fromkeys(STATS_COUNTERS, 0)
+        stats.update(await cursor.fetchall())
         return stats
 
+async def get_game_stats(since: datetime) -> List[Dict]:
+    """Ставки по играм и типу валюты с момента since: число, объём, выплаты и RTP.
+    
+    created_at хранится в UTC (CURRENT_TIMESTAMP); наивный since считается местным временем
+    """
+    since = since.astimezone(timezone.utc)
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('''
+            SELECT game, is_demo, COUNT(*) AS bets, COUNT(DISTINCT user_id) AS players,
+                   SUM(stake) AS volume, SUM(payout) AS paid,
+                   SUM(payout > 0) AS wins
+            FROM bets WHERE created_at >= ?
+            GROUP BY game, is_demo
+            ORDER BY is_demo, volume DESC
+        ''', (since.strftime("%Y-%m-%d %H:%M:%S"),))
+        stats = [dict(row) for row in await cursor.fetchall()]
+    for row in stats:
+        row['rtp'] = row['paid'] / row['volume'] if row['volume'] else 0.0
+    return stats
+
 # ===== ИГРОВЫЕ ЗАКАЗЫ =====
 async def create_game_order(creator_id: int, category: str, resource: str,
                             amount: int, total_reward: int, executor_reward: int,
                             description: str = "") -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT INTO game_orders 
             (creator_id, resource_category, resource_type, resource_amount,
@@ -1082,26 +2162,22 @@ async def create_game_order(creator_id: int, category: str, resource: str,
         await db.commit()
         return cursor.lastrowid
 
-async def get_open_orders(page: int = 0, per_page: int = 5) -> tuple:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def get_open_orders(cursor: Optional[str] = None, per_page: int = 5) -> tuple:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         
-        cursor = await db.execute("SELECT COUNT(*) FROM game_orders WHERE status = 'open'")
-        total = (await cursor.fetchone())[0]
+        total = await _get_counter(db, "open_orders")
         
-        cursor = await db.execute('''
+        orders, prev_cursor, next_cursor = await _keyset_page(db, '''
             SELECT go.*, u.username as creator_username, u.full_name as creator_name
             FROM game_orders go
             JOIN users u ON go.creator_id = u.user_id
             WHERE go.status = 'open'
-            ORDER BY go.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (per_page, page * per_page))
-        
-        return [dict(row) for row in await cursor.fetchall()], total
+        ''', (), "go", cursor, per_page)
+        return orders, total, prev_cursor, next_cursor
 
 async def get_all_orders_admin() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT go.*, 
@@ -1116,7 +2192,7 @@ async def get_all_orders_admin() -> List[Dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 async def get_order(order_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT go.*, 
@@ -1131,7 +2207,7 @@ async def get_order(order_id: int) -> Optional[Dict]:
         return dict(row) if row else None
 
 async def take_order(order_id: int, executor_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute(
             "SELECT creator_id, status FROM game_orders WHERE id = ?", 
             (order_id,)
@@ -1149,7 +2225,7 @@ async def take_order(order_id: int, executor_id: int) -> bool:
         return True
 
 async def complete_order(order_id: int) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("SELECT * FROM game_orders WHERE id = ?", (order_id,))
         order = await cursor.fetchone()
@@ -1163,8 +2239,16 @@ async def complete_order(order_id: int) -> Optional[Dict]:
         await db.commit()
         return dict(order)
 
+async def set_order_status(order_id: int, status: str) -> None:
+    async with acquire() as db:
+        await db.execute(
+            "UPDATE game_orders SET status = ? WHERE id = ?",
+            (status, order_id)
+        )
+        await db.commit()
+
 async def cancel_order(order_id: int, user_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute(
             "SELECT creator_id, status, total_reward FROM game_orders WHERE id = ?",
             (order_id,)
@@ -1186,10 +2270,11 @@ async def cancel_order(order_id: int, user_id: int) -> bool:
             (order_id,)
         )
         await db.commit()
+        _user_cache.invalidate(creator_id)
         return True
 
 async def get_user_orders(user_id: int) -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM game_orders 
@@ -1200,7 +2285,7 @@ async def get_user_orders(user_id: int) -> List[Dict]:
 
 # ===== ПОДПИСКИ =====
 async def get_subscription_channels() -> List[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             "SELECT * FROM subscription_channels WHERE is_active = TRUE"
@@ -1209,7 +2294,7 @@ async def get_subscription_channels() -> List[Dict]:
 
 async def add_subscription_channel(channel_id: str, name: str, 
                                     channel_type: str = "channel") -> int:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         cursor = await db.execute('''
             INSERT OR REPLACE INTO subscription_channels (channel_id, channel_name, channel_type)
             VALUES (?, ?, ?)
@@ -1218,7 +2303,7 @@ async def add_subscription_channel(channel_id: str, name: str,
         return cursor.lastrowid
 
 async def remove_subscription_channel(channel_id: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute(
             "UPDATE subscription_channels SET is_active = FALSE WHERE channel_id = ?",
             (channel_id,)
@@ -1226,7 +2311,7 @@ async def remove_subscription_channel(channel_id: str) -> None:
         await db.commit()
 
 async def get_user_subscription(user_id: int, channel_id: str) -> Optional[Dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM user_subscriptions 
@@ -1236,22 +2321,294 @@ async def get_user_subscription(user_id: int, channel_id: str) -> Optional[Dict]
         return dict(row) if row else None
 
 async def add_user_subscription(user_id: int, channel_id: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
-            INSERT INTO user_subscriptions (user_id, channel_id)
+            INSERT OR IGNORE INTO user_subscriptions (user_id, channel_id)
             VALUES (?, ?)
         ''', (user_id, channel_id))
         await db.commit()
 
 async def remove_user_subscription(user_id: int, channel_id: str) -> None:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with acquire() as db:
         await db.execute('''
             UPDATE user_subscriptions SET is_active = FALSE
             WHERE user_id = ? AND channel_id = ?
         ''', (user_id, channel_id))
         await db.commit()
 
-async def get_all_user_ids() -> List[int]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute("SELECT user_id FROM users")
-        return [row[0] for row in await cursor.fetchall()]
\ No newline at end of file
+# Условия для массовых обходов; в SQL попадают только ключи этого словаря
+USER_FILTERS = {
+    "all": "1",
+    "registered": "is_registered = TRUE",
+    "reachable": "reachable = TRUE",
+}
+# Счётчик из stats_counters с размером выборки для каждого фильтра
+USER_FILTER_COUNTERS = {
+    "all": "total_users",
+    "registered": "registered_users",
+    "reachable": "reachable_users",
+}
+
+async def mark_users_unreachable(user_ids: List[int]) -> None:
+    """Отмечает получателей, которым Telegram больше не доставит сообщения"""
+    if not user_ids:
+        return
+    now = datetime.now()
+    async with acquire() as db:
+        await db.executemany(
+            "UPDATE users SET reachable = FALSE, blocked_at = ? WHERE user_id = ? AND reachable = TRUE",
+            [(now, user_id) for user_id in user_ids]
+        )
+        await db.commit()
+    _user_cache.invalidate(*user_ids)
+
+async def mark_user_reachable(user_id: int) -> None:
+    async with acquire() as db:
+        await db.execute(
+            "UPDATE users SET reachable = TRUE, blocked_at = NULL WHERE user_id = ? AND reachable = FALSE",
+            (user_id,)
+        )
+        await db.commit()
+    _user_cache.invalidate(user_id)
+
+async def iter_user_ids(filter: str = "all", batch: int = 1000,
+                        after: int = 0) -> AsyncIterator[int]:
+    """Потоковый обход user_id по возрастанию кусками по batch (keyset по первичному ключу).
+    Соединение держится только на время выборки куска, after — продолжить после этого id"""
+    condition = USER_FILTERS[filter]
+    last_id = after
+    while True:
+        async with acquire() as db:
+            cursor = await db.execute(f'''
+                SELECT user_id FROM users
+                WHERE user_id > ? AND {condition}
+                ORDER BY user_id LIMIT ?
+            ''', (last_id, batch))
+            chunk = [row[0] for row in await cursor.fetchall()]
+        
+        for user_id in chunk:
+            yield user_id
+        
+        if len(chunk) < batch:
+            return
+        last_id = chunk[-1]
+# ===== РАССЫЛКИ =====
+async def create_broadcast_job(created_by: int, chat_id: int, message_id: int,
+                               text: str, photo: Optional[str] = None,
+                               user_filter: str = "all") -> int:
+    total = (await get_stats())[USER_FILTER_COUNTERS[user_filter]]
+    async with acquire() as db:
+        cursor = await db.execute('''
+            INSERT INTO broadcast_jobs (created_by, chat_id, message_id, text, photo, user_filter, total)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (created_by, chat_id, message_id, text, photo, user_filter, total))
+        await db.commit()
+        return cursor.lastrowid
+
+async def get_broadcast_job(job_id: int) -> Optional[Dict]:
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+async def get_running_broadcast_jobs() -> List[Dict]:
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+        return [dict(row) for row in await cursor.fetchall()]
+
+async def save_broadcast_progress(job_id: int, cursor: int, sent: int, failed: int) -> None:
+    async with acquire() as db:
+        await db.execute('''
+            UPDATE broadcast_jobs SET cursor = ?, sent = ?, failed = ? WHERE id = ?
+        ''', (cursor, sent, failed, job_id))
+        await db.commit()
+
+async def finish_broadcast_job(job_id: int, status: str = "done") -> bool:
+    """Завершает только идущую рассылку; False, если она уже закончена или не найдена"""
+    async with acquire() as db:
+        cursor = await db.execute('''
+            UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'running'
+        ''', (status, datetime.now(), job_id))
+        await db.commit()
+        return cursor.rowcount > 0
+
+# ===== СОСТОЯНИЯ FSM =====
+async def load_fsm_state(key: str) -> Optional[tuple]:
+    """(state, data в JSON) или None"""
+    async with acquire() as db:
+        cursor = await db.execute("SELECT state, data FROM fsm_states WHERE key = ?", (key,))
+        return await cursor.fetchone()
+
+async def save_fsm_states(rows: List[tuple], deleted: List[str]) -> None:
+    """Пишет пачку (key, state, data) и удаляет пустые состояния одной транзакцией"""
+    now = datetime.now()
+    async with acquire() as db:
+        if rows:
+            await db.executemany(
+                "INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                [(key, state, data, now) for key, state, data in rows]
+            )
+        if deleted:
+            await db.executemany("DELETE FROM fsm_states WHERE key = ?", [(key,) for key in deleted])
+        await db.commit()
+
+async def delete_stale_fsm_states(older_than: timedelta) -> List[str]:
+    """Удаляет состояния, не менявшиеся дольше older_than, возвращает их ключи"""
+    async with acquire() as db:
+        cursor = await db.execute(
+            "DELETE FROM fsm_states WHERE updated_at < ? RETURNING key",
+            (datetime.now() - older_than,)
+        )
+        keys = [row[0] for row in await cursor.fetchall()]
+        await db.commit()
+        return keys
+
+# ===== АРХИВ ЛЕДЖЕРА =====
+# Старые строки transactions переезжают в отдельную БД ARCHIVE_DATABASE_PATH, а их суммы
+# копятся в archived_transaction_totals. Это только итоги перенесённых операций, не баланс:
+# бонусы, возвраты, правки админа и стартовый демо-баланс меняют баланс без строк в transactions
+@asynccontextmanager
+async def _attached_archive():
+    """Соединение из пула с подключённой архивной БД под именем archive"""
+    async with acquire() as db:
+        await db.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_PATH,))
+        try:
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS archive.transactions (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    amount INTEGER,
+                    type TEXT,
+                    description TEXT,
+                    created_at TIMESTAMP
+                )
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_archive_transactions_user
+                ON transactions(user_id, created_at)
+            ''')
+            await db.commit()
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            await db.execute("DETACH DATABASE archive")
+
+async def archive_transactions(older_than: timedelta, batch: int = 5000) -> int:
+    """Переносит транзакции старше older_than (до начала суток UTC) в архив, возвращает число строк"""
+    # created_at пишется CURRENT_TIMESTAMP, то есть в UTC — граница тоже в UTC
+    cutoff = (datetime.now(timezone.utc) - older_than).strftime("%Y-%m-%d 00:00:00")
+    moved = 0
+    async with _attached_archive() as db:
+        while True:
+            cursor = await db.execute('''
+                SELECT MAX(id), COUNT(*) FROM (
+                    SELECT id FROM main.transactions WHERE created_at < ? ORDER BY id LIMIT ?
+                )
+            ''', (cutoff, batch))
+            last_id, count = await cursor.fetchone()
+            if not count:
+                break
+            
+            # 1. Копия в архив. Повторный запуск после сбоя не задвоит строки (OR IGNORE по id)
+            await db.execute('''
+                INSERT OR IGNORE INTO archive.transactions
+                SELECT id, user_id, amount, type, description, created_at
+                FROM main.transactions WHERE id <= ? AND created_at < ?
+            ''', (last_id, cutoff))
+            await db.commit()
+            
+            # 2. Чекпоинт и удаление — одной транзакцией в основной БД
+            await db.execute('''
+                INSERT INTO main.archived_transaction_totals
+                    (user_id, archived_real, archived_demo, archived_count, archived_through_id, updated_at)
+                SELECT user_id,
+                       COALESCE(SUM(CASE WHEN type = 'demo' THEN 0 ELSE amount END), 0),
+                       COALESCE(SUM(CASE WHEN type = 'demo' THEN amount ELSE 0 END), 0),
+                       COUNT(*), MAX(id), CURRENT_TIMESTAMP
+                FROM main.transactions WHERE id <= ? AND created_at < ?
+                GROUP BY user_id
+                ON CONFLICT(user_id) DO UPDATE SET
+                    archived_real = archived_real + excluded.archived_real,
+                    archived_demo = archived_demo + excluded.archived_demo,
+                    archived_count = archived_count + excluded.archived_count,
+                    archived_through_id = MAX(archived_through_id, excluded.archived_through_id),
+                    updated_at = excluded.updated_at
+            ''', (last_id, cutoff))
+            cursor = await db.execute(
+                "DELETE FROM main.transactions WHERE id <= ? AND created_at < ?",
+                (last_id, cutoff)
+            )
+            await db.commit()
+            moved += cursor.rowcount
+            
+            if count < batch:
+                break
+            await asyncio.sleep(0)
+    return moved
+
+async def get_user_transactions(user_id: int, limit: int = 10) -> List[Dict]:
+    """Последние операции из горячей таблицы"""
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('''
+            SELECT * FROM transactions WHERE user_id = ?
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (user_id, limit))
+        return [dict(row) for row in await cursor.fetchall()]
+
+async def get_archived_transactions(user_id: int, limit: int = 50,
+                                    before_id: Optional[int] = None) -> List[Dict]:
+    """Операции из архива, от новых к старым; before_id — для постраничного чтения"""
+    async with _attached_archive() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('''
+            SELECT * FROM archive.transactions
+            WHERE user_id = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        ''', (user_id, before_id or 2 ** 63 - 1, limit))
+        return [dict(row) for row in await cursor.fetchall()]
+
+async def get_archived_totals(user_id: int) -> Optional[Dict]:
+    """Сколько операций пользователя ушло в архив и на какие суммы"""
+    async with acquire() as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            "SELECT * FROM archived_transaction_totals WHERE user_id = ?", (user_id,)
+        )
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+# ===== ПРОФИЛИРОВАНИЕ ФУНКЦИЙ =====
+def _count_rows(result: Any) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        # (страница, курсоры/total)
+        return len(result[0])
+    if isinstance(result, dict):
+        return 1
+    return 0
+
+def _profiled(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await func(*args, **kwargs)
+            return result
+        finally:
+            metrics.record_db_call(name, time.perf_counter() - started, _count_rows(result))
+    return wrapper
+
+# Оборачиваем все публичные корутины модуля, в том числе для вызовов изнутри него
+if DB_PROFILING:
+    for _name, _func in list(globals().items()):
+        if (not _name.startswith("_") and inspect.iscoroutinefunction(_func)
+                and _func.__module__ == __name__):
+            globals()[_name] = _profiled(_func)
@@ -1,10 +1,15 @@
+import time
+from datetime import datetime, timedelta
 from aiogram import Router, F, Bot
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 
+import broadcast
 import database as db
 import keyboards as kb
-from config import RESOURCES_CATEGORIES, PRIVILEGES, WITHDRAW_PACKS
+import metrics
+from config import RESOURCES_CATEGORIES, PRIVILEGES, WITHDRAW_PACKS, GAME_NAMES
 
 from states import (
     CreateGameTask, CreateCardTask, AddAdmin, UpdateAdminProfile,
@@ -985,19 +990,13 @@ async def add_admin_nick(message: Message, state: FSMContext, bot: Bot):
     await message.answer("✅ Админ добавлен!", reply_markup=kb.get_back_button("manage_admins"))
 
 # ===== СТАТИСТИКА =====
-@router.callback_query(F.data == "admin_stats")
-async def admin_stats(callback: CallbackQuery):
-    if not await db.is_admin(callback.from_user.id):
-        await callback.answer("❌ Нет доступа", show_alert=True)
-        return
-    
-    stats = await db.get_stats()
-    
-    text = f"""
+def format_stats(stats: dict) -> str:
+    return f"""
 📊 <b>Статистика</b>
 
 👥 Пользователей: {stats['total_users']}
 ✅ Зарегистрировано: {stats['registered_users']}
+📬 Доступны для рассылки: {stats['reachable_users']}
 
 🎮 Игровых заданий: {stats['active_game_tasks']}
 💳 Заданий с картами: {stats['active_card_tasks']}
@@ -1009,13 +1008,168 @@ async def admin_stats(callback: CallbackQuery):
 💰 Общий баланс: {stats['total_balance']:,}
 🎁 Промокодов: {stats['active_promos']}
 """
+
+@router.callback_query(F.data == "admin_stats")
+async def admin_stats(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    stats = await db.get_stats()
+    
     await callback.message.edit_text(
-        text, 
-        reply_markup=kb.get_back_button("admin_panel"), 
+        format_stats(stats), 
+        reply_markup=kb.get_admin_stats_menu(), 
         parse_mode="HTML"
     )
     await callback.answer()
 
+@router.callback_query(F.data == "admin_stats_rebuild")
+async def admin_stats_rebuild(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    stats = await db.rebuild_stats()
+    
+    try:
+        await callback.message.edit_text(
+            format_stats(stats), 
+            reply_markup=kb.get_admin_stats_menu(), 
+            parse_mode="HTML"
+        )
+    except:
+        # Счётчики не разошлись — текст не изменился
+        pass
+    await callback.answer("✅ Статистика пересчитана")
+
+# ===== ПРОИЗВОДИТЕЛЬНОСТЬ =====
+PERF_TOP = 15
+
+def format_perf() -> str:
+    handlers = metrics.get_handler_stats()
+    minutes = max((time.time() - metrics.get_stats_since()) / 60, 1 / 60)
+    updates = sum(h['count'] for h in handlers)
+    text = (
+        f"⚡ <b>Производительность</b>\n"
+        f"<i>за {minutes:.0f} мин: {updates} обновлений, {updates / minutes:.1f}/мин</i>\n\n"
+    )
+    if not handlers:
+        return text + "<i>Пока нет данных</i>"
+    
+    # Сверху — обработчики, съевшие больше всего времени
+    for h in handlers[:PERF_TOP]:
+        errors = f", ❌ {h['errors']}" if h['errors'] else ""
+        text += (
+            f"<b>{h['name']}</b> — {h['count']}{errors}\n"
+            f"  ср {h['avg_ms']:.0f} · p50 {h['p50_ms']:.0f} · p99 {h['p99_ms']:.0f} · max {h['max_ms']:.0f} мс\n"
+            f"  БД {h['db_avg_ms']:.0f} мс · API {h['api_avg_ms']:.0f} мс\n"
+        )
+    
+    pool = db.get_pool_stats()
+    if pool:
+        text += (
+            f"\n🗄 Пул БД: свободно {pool['free']}/{pool['size']}, "
+            f"ожидание ср {pool['wait_avg'] * 1000:.1f} мс, таймаутов {pool['timeouts']}"
+        )
+    return text
+
+@router.callback_query(F.data == "admin_perf")
+async def admin_perf(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await callback.message.edit_text(format_perf(), reply_markup=kb.get_admin_perf_menu(), parse_mode="HTML")
+    except:
+        # Ничего не изменилось с прошлого обновления
+        pass
+    await callback.answer()
+
+@router.callback_query(F.data == "admin_perf_reset")
+async def admin_perf_reset(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    metrics.reset_handler_stats()
+    try:
+        await callback.message.edit_text(format_perf(), reply_markup=kb.get_admin_perf_menu(), parse_mode="HTML")
+    except:
+        # Повторный сброс пустой статистики не меняет текст
+        pass
+    await callback.answer("✅ Статистика сброшена")
+
+DB_STATS_TOP = 10
+
+def format_db_stats() -> str:
+    """Самые затратные функции database.py и SQL-запросы"""
+    lines = ["🗄 <b>Время в БД</b>\n", "<b>Функции:</b>"]
+    for f in metrics.get_db_function_stats()[:DB_STATS_TOP]:
+        lines.append(
+            f"<code>{f['name']}</code> ×{f['count']}, Σ {f['total_ms']:.0f} мс\n"
+            f"  p50 {f['p50_ms']:.1f} · p95 {f['p95_ms']:.1f} · p99 {f['p99_ms']:.1f} мс, строк ~{f['rows_avg']:.1f}"
+        )
+    lines.append("\n<b>Запросы:</b>")
+    for q in metrics.get_db_statement_stats()[:DB_STATS_TOP]:
+        sql = q['name'][:120].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        lines.append(
+            f"<code>{sql}</code>\n"
+            f"  ×{q['count']}, Σ {q['total_ms']:.0f} мс, p95 {q['p95_ms']:.1f} мс, строк ~{q['rows_avg']:.1f}"
+        )
+    
+    # Лимит сообщения Telegram — 4096 символов, режем по целым строкам
+    text = ""
+    for line in lines:
+        if len(text) + len(line) > 4000:
+            break
+        text += line + "\n"
+    return text
+
+@router.message(Command("db_stats"))
+async def cmd_db_stats(message: Message, command: CommandObject):
+    if not await db.is_admin(message.from_user.id):
+        return
+    
+    if command.args == "reset":
+        metrics.reset_db_stats()
+        await message.answer("✅ Статистика запросов сброшена")
+        return
+    
+    await message.answer(format_db_stats(), parse_mode="HTML")
+
+# ===== СТАТИСТИКА ИГР =====
+GAME_STATS_DAYS = 30
+
+def format_game_stats(stats: list, days: int) -> str:
+    """Оборот, выплаты и RTP по играм из таблицы bets"""
+    lines = [f"🎮 <b>Ставки за {days} дн.</b>\n"]
+    if not stats:
+        lines.append("Ставок не было")
+    for g in stats:
+        currency = "🪙 серебро" if g['is_demo'] else "💰 монеты"
+        lines.append(
+            f"<b>{GAME_NAMES.get(g['game'], g['game'])}</b>, {currency}\n"
+            f"  ставок {g['bets']:,} от {g['players']:,} игроков, выигрышных {g['wins']:,}\n"
+            f"  оборот {g['volume']:,}, выплачено {g['paid']:,}, RTP {g['rtp']:.1%}"
+        )
+    return "\n".join(lines)
+
+@router.message(Command("game_stats"))
+async def cmd_game_stats(message: Message, command: CommandObject):
+    if not await db.is_admin(message.from_user.id):
+        return
+    
+    # /game_stats 7 — за последние 7 дней
+    try:
+        days = int(command.args) if command.args else GAME_STATS_DAYS
+    except ValueError:
+        days = GAME_STATS_DAYS
+    
+    stats = await db.get_game_stats(datetime.now() - timedelta(days=days))
+    await message.answer(format_game_stats(stats, days), parse_mode="HTML")
+
 # ===== РАССЫЛКА =====
 @router.callback_query(F.data == "broadcast")
 async def broadcast_start(callback: CallbackQuery, state: FSMContext):
@@ -1065,32 +1219,35 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot
     data = await state.get_data()
     await state.clear()
     
-    user_ids = await db.get_all_user_ids()
-    
-    await callback.message.edit_text("📤 Начинаю рассылку...")
-    
-    success = 0
-    failed = 0
+    # Отдельное сообщение под прогресс: предпросмотр может быть фото, его текст не отредактировать
+    progress = await callback.message.answer("📤 Начинаю рассылку...")
+    job_id = await db.create_broadcast_job(
+        callback.from_user.id, progress.chat.id, progress.message_id,
+        data.get('text', ''), data.get('photo'), user_filter="reachable"
+    )
+    broadcast.start_job(bot, await db.get_broadcast_job(job_id))
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("cancel_broadcast_"))
+async def cancel_broadcast(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
     
-    for user_id in user_ids:
-        try:
-            if data.get('photo'):
-                await bot.send_photo(user_id, data['photo'], caption=data.get('text', ''))
-            else:
-                await bot.send_message(user_id, data['text'])
-            success += 1
-        except:
-            failed += 1
-        
-        # Задержка чтобы не забанили
-        if success % 30 == 0:
-            import asyncio
-            await asyncio.sleep(1)
+    job_id = int(callback.data.split("_")[-1])
+    cancelled = await broadcast.cancel_job(job_id)
+    job = await db.get_broadcast_job(job_id)
+    if job is None:
+        await callback.answer("❌ Рассылка не найдена", show_alert=True)
+        return
+    if not cancelled:
+        await callback.answer("ℹ️ Рассылка уже завершена", show_alert=True)
+        return
     
     await callback.message.edit_text(
-        f"✅ <b>Рассылка завершена!</b>\n\n"
-        f"✅ Доставлено: {success}\n"
-        f"❌ Не доставлено: {failed}",
+        f"⛔ <b>Рассылка остановлена</b>\n\n"
+        f"✅ Доставлено: {job['sent']}\n"
+        f"❌ Не доставлено: {job['failed']}",
         reply_markup=kb.get_back_button("admin_panel"),
         parse_mode="HTML"
     )
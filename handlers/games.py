@@ -2,11 +2,12 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 import random
-import asyncio
+from functools import partial
 
 import database as db
 import keyboards as kb
-from config import MIN_BET, WIN_CHANCE, ROULETTE_MULTIPLIERS
+from background import deliver_later
+from config import MIN_BET, WIN_CHANCE, ROULETTE_MULTIPLIERS, DICE_ANIMATION_DELAY, ROULETTE_SPIN_DELAY
 from states import PlayGame
 
 router = Router()
@@ -91,15 +92,18 @@ async def process_bet(message: Message, state: FSMContext):
         return
     
     data = await state.get_data()
-    user = await db.get_user(message.from_user.id)
-    balance = user['demo_balance'] if data['is_demo'] else user['balance']
+    game = data['game']
     
-    if balance < bet:
-        await message.answer("❌ Недостаточно средств!")
-        return
+    # Кубик и рулетка принимают ставку позже — здесь только проверка для подсказки
+    if game in ["cube", "roulette"]:
+        user = await db.get_user(message.from_user.id)
+        balance = user['demo_balance'] if data['is_demo'] else user['balance']
+        
+        if balance < bet:
+            await message.answer("❌ Недостаточно средств!")
+            return
     
     await state.update_data(bet=bet)
-    game = data['game']
     
     if game == "cube":
         await state.set_state(PlayGame.cube_guess)
@@ -118,11 +122,15 @@ async def process_bet(message: Message, state: FSMContext):
         )
     
     elif game == "minesweeper":
-        await db.update_balance(message.from_user.id, -bet, "Ставка: сапёр", data['is_demo'])
+        # Исход известен только при выходе: ставка сейчас, выигрыш потом через pay_bet
+        bet_id = await db.settle_bet(message.from_user.id, "minesweeper", bet, 0, data['is_demo'])
+        if bet_id is None:
+            await message.answer("❌ Недостаточно средств!")
+            return
         bombs = random.sample(range(9), 3)
         
         await state.set_state(PlayGame.minesweeper)
-        await state.update_data(bombs=bombs, revealed=[], multiplier=1.0)
+        await state.update_data(bet_id=bet_id, bombs=bombs, revealed=[], multiplier=1.0)
         
         await message.answer(
             f"💣 <b>Сапёр</b>\n\n"
@@ -134,13 +142,16 @@ async def process_bet(message: Message, state: FSMContext):
         )
     
     elif game in ["basketball", "darts"]:
+        # Ставка списывается до броска, выигрыш — после исхода через pay_bet
+        bet_id = await db.settle_bet(message.from_user.id, game, bet, 0, data['is_demo'])
+        if bet_id is None:
+            await message.answer("❌ Недостаточно средств!")
+            return
         await state.clear()
-        await db.update_balance(message.from_user.id, -bet, f"Ставка: {game}", data['is_demo'])
         
         emoji = "🏀" if game == "basketball" else "🎯"
         await message.answer(f"{emoji} Бросаем...")
         dice = await message.answer_dice(emoji=emoji)
-        await asyncio.sleep(4)
         
         # 8% шанс или успешный бросок
         if game == "basketball":
@@ -150,12 +161,15 @@ async def process_bet(message: Message, state: FSMContext):
         
         if win:
             winnings = bet * 2
-            await db.update_balance(message.from_user.id, winnings, f"Выигрыш: {game}", data['is_demo'])
+            await db.pay_bet(bet_id, message.from_user.id, winnings, data['is_demo'])
             result = f"🎉 <b>Победа!</b>\n💰 +{winnings}"
         else:
             result = f"😔 <b>Мимо!</b>\n💸 -{bet}"
         
-        await message.answer(result, reply_markup=kb.get_games_menu(), parse_mode="HTML")
+        # Итог уже в БД, а сообщение придёт после анимации: обработчик её не ждёт
+        deliver_later(DICE_ANIMATION_DELAY, partial(
+            message.answer, result, reply_markup=kb.get_games_menu(), parse_mode="HTML"
+        ), f"result:{game}")
 
 # ===== КУБИК =====
 @router.callback_query(PlayGame.cube_guess, F.data.startswith("cube_guess_"))
@@ -166,23 +180,28 @@ async def cube_guess(callback: CallbackQuery, state: FSMContext):
     is_demo = data['is_demo']
     
     await state.clear()
-    await db.update_balance(callback.from_user.id, -bet, "Ставка: кубик", is_demo)
+    bet_id = await db.settle_bet(callback.from_user.id, "cube", bet, 0, is_demo)
+    if bet_id is None:
+        await callback.message.edit_text("❌ Недостаточно средств!", reply_markup=kb.get_games_menu())
+        await callback.answer()
+        return
     
     await callback.message.edit_text(f"🎲 Выбор: <b>{guess}</b>\n\nБросаем...", parse_mode="HTML")
     dice = await callback.message.answer_dice(emoji="🎲")
-    await asyncio.sleep(4)
     
     actual = dice.dice.value
     win = random.random() < WIN_CHANCE or actual == guess
     
     if win:
         winnings = bet * 2
-        await db.update_balance(callback.from_user.id, winnings, "Выигрыш: кубик", is_demo)
+        await db.pay_bet(bet_id, callback.from_user.id, winnings, is_demo)
         result = f"🎉 <b>Угадали!</b>\n🎲 Выпало: {actual if actual == guess else guess}\n💰 +{winnings}"
     else:
         result = f"😔 <b>Не угадали!</b>\n🎲 Выпало: {actual}\n💸 -{bet}"
     
-    await callback.message.answer(result, reply_markup=kb.get_games_menu(), parse_mode="HTML")
+    deliver_later(DICE_ANIMATION_DELAY, partial(
+        callback.message.answer, result, reply_markup=kb.get_games_menu(), parse_mode="HTML"
+    ), "result:cube")
     await callback.answer()
 
 # ===== РУЛЕТКА =====
@@ -194,7 +213,6 @@ async def roulette_spin(callback: CallbackQuery, state: FSMContext):
     is_demo = data['is_demo']
     
     await state.clear()
-    await db.update_balance(callback.from_user.id, -bet, "Ставка: рулетка", is_demo)
     
     # Выбираем результат по шансам
     roll = random.random()
@@ -211,20 +229,34 @@ async def roulette_spin(callback: CallbackQuery, state: FSMContext):
     if random.random() < WIN_CHANCE:
         result_mult = target_mult
     
+    winnings = int(bet * result_mult) if result_mult == target_mult else 0
+    if await db.settle_bet(callback.from_user.id, "roulette", bet, winnings, is_demo) is None:
+        await callback.message.edit_text("❌ Недостаточно средств!", reply_markup=kb.get_games_menu())
+        await callback.answer()
+        return
+    
     await callback.message.edit_text("🎰 Крутим рулетку...", parse_mode="HTML")
-    await asyncio.sleep(2)
     
-    if result_mult == target_mult:
-        winnings = int(bet * result_mult)
-        await db.update_balance(callback.from_user.id, winnings, "Выигрыш: рулетка", is_demo)
+    if winnings:
         result = f"🎉 <b>Выпало x{result_mult}!</b>\n💰 +{winnings}"
     else:
         result = f"😔 <b>Выпало x{result_mult}</b>\nВы ставили на x{target_mult}\n💸 -{bet}"
     
-    await callback.message.edit_text(result, reply_markup=kb.get_games_menu(), parse_mode="HTML")
+    # Новым сообщением, как у кубиков: за время вращения пользователь мог уйти с этого экрана
+    deliver_later(ROULETTE_SPIN_DELAY, partial(
+        callback.message.answer, result, reply_markup=kb.get_games_menu(), parse_mode="HTML"
+    ), "result:roulette")
     await callback.answer()
 
 # ===== САПЁР =====
+async def pay_minesweeper(user_id: int, data: dict, winnings: int) -> bool:
+    """Выплата по ставке из process_bet; False — по этой ставке уже заплатили"""
+    if 'bet_id' not in data:
+        # Игра начата до появления таблицы bets (состояние FSM пережило обновление)
+        await db.update_balance(user_id, winnings, "Выигрыш: сапёр", data['is_demo'])
+        return True
+    return await db.pay_bet(data['bet_id'], user_id, winnings, data['is_demo'])
+
 @router.callback_query(PlayGame.minesweeper, F.data.startswith("mine_"))
 async def minesweeper_click(callback: CallbackQuery, state: FSMContext):
     action = callback.data.replace("mine_", "")
@@ -238,11 +270,13 @@ async def minesweeper_click(callback: CallbackQuery, state: FSMContext):
     revealed = data['revealed']
     bet = data['bet']
     multiplier = data['multiplier']
-    is_demo = data['is_demo']
     
     if action == "cashout":
         winnings = int(bet * multiplier)
-        await db.update_balance(callback.from_user.id, winnings, "Выигрыш: сапёр", is_demo)
+        if not await pay_minesweeper(callback.from_user.id, data, winnings):
+            await state.clear()
+            await callback.answer("Выигрыш уже получен")
+            return
         await state.clear()
         
         await callback.message.edit_text(
@@ -286,7 +320,10 @@ async def minesweeper_click(callback: CallbackQuery, state: FSMContext):
     if all(c in revealed for c in safe_cells):
         multiplier = 5.0
         winnings = int(bet * multiplier)
-        await db.update_balance(callback.from_user.id, winnings, "Выигрыш: сапёр (полный)", is_demo)
+        if not await pay_minesweeper(callback.from_user.id, data, winnings):
+            await state.clear()
+            await callback.answer("Выигрыш уже получен")
+            return
         await state.clear()
         
         await callback.message.edit_text(
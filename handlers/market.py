@@ -101,24 +101,16 @@ async def buy_market_item(callback: CallbackQuery):
         await callback.answer("❌ Товар не найден", show_alert=True)
         return
     
-    user = await db.get_user(callback.from_user.id)
-    
-    if not user:
-        await callback.answer("❌ Ошибка пользователя", show_alert=True)
+    # Сначала закрепляем покупку (уникальный индекс), затем атомарно списываем
+    if not await db.purchase_market_item(callback.from_user.id, item_id):
+        await callback.answer("❌ Вы уже купили это!", show_alert=True)
         return
     
-    if user['balance'] < item['price']:
+    if await db.debit_if_sufficient(callback.from_user.id, item['price'], f"Покупка: {item['name']}") is None:
+        await db.cancel_market_purchase(callback.from_user.id, item_id)
         await callback.answer("❌ Недостаточно монет!", show_alert=True)
         return
     
-    if await db.has_purchased_item(callback.from_user.id, item_id):
-        await callback.answer("❌ Вы уже купили это!", show_alert=True)
-        return
-    
-    # Списываем деньги
-    await db.update_balance(callback.from_user.id, -item['price'], f"Покупка: {item['name']}")
-    await db.purchase_market_item(callback.from_user.id, item_id)
-    
     # Выдаём награду
     reward_text = ""
     if item['reward_type'] == 'coins':
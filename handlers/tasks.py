@@ -25,18 +25,29 @@ async def tasks_menu(callback: CallbackQuery):
     await callback.message.edit_text(text, reply_markup=kb.get_tasks_menu(), parse_mode="HTML")
     await callback.answer()
 
+def parse_page(data: str, prefix: str) -> tuple:
+    """open_orders_2_<курсор> -> (2, курсор); open_orders_0 -> (0, None)"""
+    page, _, cursor = data[len(prefix):].partition("_")
+    return int(page), cursor or None
+
 # ===== ОТКРЫТЫЕ ЗАКАЗЫ =====
 @router.callback_query(F.data.startswith("open_orders_"))
 async def open_orders(callback: CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    orders, total = await db.get_open_orders(page, TASKS_PER_PAGE)
+    page, cursor = parse_page(callback.data, "open_orders_")
+    orders, total, prev_cursor, next_cursor = await db.get_open_orders(cursor, TASKS_PER_PAGE)
+    if prev_cursor is None:
+        page = 0
     
-    if not orders and page == 0:
+    if not orders:
         text = "📦 <b>Открытые заказы</b>\n\n😔 Нет доступных заказов"
         await callback.message.edit_text(text, reply_markup=kb.get_back_button("tasks_menu"), parse_mode="HTML")
     else:
         text = f"📦 <b>Открытые заказы</b>\n\nВсего: <b>{total}</b>\n\n<i>Комиссия: {int(TASK_COMMISSION*100)}%</i>"
-        await callback.message.edit_text(text, reply_markup=kb.get_orders_list(orders, page, total), parse_mode="HTML")
+        await callback.message.edit_text(
+            text,
+            reply_markup=kb.get_orders_list(orders, page, total, prev_cursor, next_cursor),
+            parse_mode="HTML"
+        )
     await callback.answer()
 
 @router.callback_query(F.data.startswith("view_order_"))
@@ -189,17 +200,14 @@ async def order_description(message: Message, state: FSMContext):
     # Второй ввод - описание
     description = message.text if message.text != "-" else ""
     
-    user = await db.get_user(message.from_user.id)
     total = data['total']
     
-    if user['balance'] < total:
+    # Списываем деньги и создаём заказ
+    if await db.debit_if_sufficient(message.from_user.id, total, "Создание заказа") is None:
         await state.clear()
         await message.answer("❌ Недостаточно монет!")
         return
     
-    # Списываем деньги и создаём заказ
-    await db.update_balance(message.from_user.id, -total, f"Создание заказа")
-    
     order_id = await db.create_game_order(
         message.from_user.id,
         data['category'],
@@ -290,12 +298,7 @@ async def submit_order_proof(message: Message, state: FSMContext, bot: Bot):
             return
         
         # Меняем статус на ожидание подтверждения
-        async with db.aiosqlite.connect(db.DATABASE_PATH) as conn:
-            await conn.execute(
-                "UPDATE game_orders SET status = 'pending_confirm' WHERE id = ?",
-                (order_id,)
-            )
-            await conn.commit()
+        await db.set_order_status(order_id, 'pending_confirm')
         
         # Отправляем фото заказчику
         try:
@@ -390,12 +393,7 @@ async def reject_order(callback: CallbackQuery, bot: Bot):
         return
     
     # Возвращаем в статус выполнения
-    async with db.aiosqlite.connect(db.DATABASE_PATH) as conn:
-        await conn.execute(
-            "UPDATE game_orders SET status = 'in_progress' WHERE id = ?",
-            (order_id,)
-        )
-        await conn.commit()
+    await db.set_order_status(order_id, 'in_progress')
     
     # Уведомляем исполнителя
     try:
@@ -552,15 +550,21 @@ async def check_subscriptions(callback: CallbackQuery, bot: Bot):
 # ===== ЗАДАНИЯ С КАРТАМИ (оставляем как было) =====
 @router.callback_query(F.data.startswith("card_tasks_"))
 async def card_tasks(callback: CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    tasks, total = await db.get_active_card_tasks(page, TASKS_PER_PAGE)
+    page, cursor = parse_page(callback.data, "card_tasks_")
+    tasks, total, prev_cursor, next_cursor = await db.get_active_card_tasks(cursor, TASKS_PER_PAGE)
+    if prev_cursor is None:
+        page = 0
     
-    if not tasks and page == 0:
+    if not tasks:
         text = "💳 <b>Задания с картами</b>\n\n😔 Нет активных заданий"
         await callback.message.edit_text(text, reply_markup=kb.get_back_button("tasks_menu"), parse_mode="HTML")
     else:
         text = f"💳 <b>Задания с картами</b>\n\nВсего: <b>{total}</b>"
-        await callback.message.edit_text(text, reply_markup=kb.get_card_tasks_list(tasks, page, total), parse_mode="HTML")
+        await callback.message.edit_text(
+            text,
+            reply_markup=kb.get_card_tasks_list(tasks, page, total, prev_cursor, next_cursor),
+            parse_mode="HTML"
+        )
     await callback.answer()
 
 @router.callback_query(F.data.startswith("view_card_task_"))
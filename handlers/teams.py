@@ -26,13 +26,13 @@ async def teams_menu(callback: CallbackQuery):
 # ===== ПРОСМОТР ИГРОКОВ =====
 @router.callback_query(F.data == "view_players")
 async def view_players(callback: CallbackQuery):
-    profiles = await db.get_active_player_profiles()
+    profiles, total = await db.get_player_profiles_page()
     
     if not profiles:
         text = "👤 <b>Анкеты игроков</b>\n\n😔 Пока никого нет"
         await callback.message.edit_text(text, reply_markup=kb.get_back_button("teams_menu"), parse_mode="HTML")
     else:
-        text = f"👤 <b>Анкеты игроков</b>\n\nНайдено: {len(profiles)}"
+        text = f"👤 <b>Анкеты игроков</b>\n\nНайдено: {total}"
         await callback.message.edit_text(
             text, 
             reply_markup=kb.get_profiles_list(profiles, "player"), 
@@ -43,8 +43,7 @@ async def view_players(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("view_player_"))
 async def view_player_profile(callback: CallbackQuery):
     profile_id = int(callback.data.split("_")[-1])
-    profiles = await db.get_active_player_profiles()
-    profile = next((p for p in profiles if p['id'] == profile_id), None)
+    profile = await db.get_player_profile(profile_id)
     
     if not profile:
         await callback.answer("❌ Анкета не найдена", show_alert=True)
@@ -74,13 +73,13 @@ async def view_player_profile(callback: CallbackQuery):
 # ===== ПРОСМОТР КЛАНОВ =====
 @router.callback_query(F.data == "view_clans")
 async def view_clans(callback: CallbackQuery):
-    profiles = await db.get_active_clan_profiles()
+    profiles, total = await db.get_clan_profiles_page()
     
     if not profiles:
         text = "🏰 <b>Анкеты кланов</b>\n\n😔 Пока ничего нет"
         await callback.message.edit_text(text, reply_markup=kb.get_back_button("teams_menu"), parse_mode="HTML")
     else:
-        text = f"🏰 <b>Анкеты кланов</b>\n\nНайдено: {len(profiles)}"
+        text = f"🏰 <b>Анкеты кланов</b>\n\nНайдено: {total}"
         await callback.message.edit_text(
             text, 
             reply_markup=kb.get_profiles_list(profiles, "clan"), 
@@ -91,8 +90,7 @@ async def view_clans(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("view_clan_"))
 async def view_clan_profile(callback: CallbackQuery):
     profile_id = int(callback.data.split("_")[-1])
-    profiles = await db.get_active_clan_profiles()
-    profile = next((p for p in profiles if p['id'] == profile_id), None)
+    profile = await db.get_clan_profile(profile_id)
     
     if not profile:
         await callback.answer("❌ Анкета не найдена", show_alert=True)
@@ -180,16 +178,14 @@ async def player_server(message: Message, state: FSMContext):
 @router.message(PlayerProfile.prev_clans)
 async def player_prev_clans(message: Message, state: FSMContext):
     data = await state.get_data()
-    user = await db.get_user(message.from_user.id)
     
-    if user['balance'] < PLAYER_PROFILE_COST:
+    if await db.debit_if_sufficient(message.from_user.id, PLAYER_PROFILE_COST, "Анкета игрока") is None:
         await state.clear()
         await message.answer("❌ Недостаточно монет!")
         return
     
     prev_clans = message.text if message.text.lower() != 'нет' else None
     
-    await db.update_balance(message.from_user.id, -PLAYER_PROFILE_COST, "Анкета игрока")
     await db.create_player_profile(
         message.from_user.id,
         data['age'],
@@ -278,14 +274,12 @@ async def clan_hours(message: Message, state: FSMContext):
         hours = 0
     
     data = await state.get_data()
-    user = await db.get_user(message.from_user.id)
     
-    if user['balance'] < CLAN_PROFILE_COST:
+    if await db.debit_if_sufficient(message.from_user.id, CLAN_PROFILE_COST, "Анкета клана") is None:
         await state.clear()
         await message.answer("❌ Недостаточно монет!")
         return
     
-    await db.update_balance(message.from_user.id, -CLAN_PROFILE_COST, "Анкета клана")
     await db.create_clan_profile(
         message.from_user.id,
         data['name'],
@@ -1,6 +1,6 @@
 from aiogram import Router, F, Bot
 from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery, LabeledPrice
+from aiogram.types import Message, CallbackQuery, LabeledPrice, ChatMemberUpdated
 from aiogram.fsm.context import FSMContext
 import random
 
@@ -274,14 +274,13 @@ async def process_withdraw(message: Message, state: FSMContext):
         return
     
     data = await state.get_data()
-    user = await db.get_user(message.from_user.id)
     
-    if user['balance'] < data['coins']:
+    if await db.debit_if_sufficient(message.from_user.id, data['coins'], f"Вывод: {data['pack_id']}",
+                                    durability=db.DURABILITY_SYNC) is None:
         await state.clear()
         await message.answer("❌ Недостаточно монет!")
         return
     
-    await db.update_balance(message.from_user.id, -data['coins'], f"Вывод: {data['pack_id']}")
     req_id = await db.create_withdraw_request(message.from_user.id, data['pack_id'], data['coins'], game_id)
     await state.clear()
     
@@ -470,13 +469,13 @@ async def yt_promo_uses(message: Message, state: FSMContext):
     data = await state.get_data()
     total_cost = data['coins'] * uses
     
-    user = await db.get_user(message.from_user.id)
-    if user['balance'] < total_cost:
+    # Списываем и создаём
+    balance = await db.debit_if_sufficient(message.from_user.id, total_cost, "Создание промокода")
+    if balance is None:
+        user = await db.get_user(message.from_user.id)
         await message.answer(f"❌ Нужно {total_cost} монет, у вас {user['balance']}")
         return
     
-    # Списываем и создаём
-    await db.update_balance(message.from_user.id, -total_cost, "Создание промокода")
     code = db.generate_promo_code()
     await db.create_promocode(code, data['coins'], uses, message.from_user.id)
     await state.clear()
@@ -506,6 +505,12 @@ async def top_players(callback: CallbackQuery):
     if not top:
         text += "<i>Пока пусто</i>"
     
+    rank, ranked = await db.get_user_rank(callback.from_user.id)
+    if rank:
+        text += f"\n📍 Ваше место: <b>#{rank}</b> из {ranked}"
+    else:
+        text += "\n📍 Вы ещё не в рейтинге — заработайте монеты!"
+    
     await callback.message.edit_text(text, reply_markup=kb.get_back_button("main_menu"), parse_mode="HTML")
     await callback.answer()
 
@@ -516,9 +521,17 @@ async def balance_history(callback: CallbackQuery):
     user = await db.get_user(callback.from_user.id)
     subs = await db.get_user_submissions(callback.from_user.id, 5)
     wds = await db.get_user_withdrawals(callback.from_user.id, 5)
+    txs = await db.get_user_transactions(callback.from_user.id, 5)
     
     text = "📜 <b>История операций</b>\n\n"
     
+    if txs:
+        text += "<b>Последние операции:</b>\n"
+        for t in txs:
+            demo = " (демо)" if t['type'] == 'demo' else ""
+            text += f"• {t['amount']:+} {t['description'] or ''}{demo}\n"
+        text += "\n"
+    
     if subs:
         text += "<b>Последние заявки:</b>\n"
         for s in subs:
@@ -531,10 +544,40 @@ async def balance_history(callback: CallbackQuery):
             st = {"pending": "🟡", "completed": "✅", "rejected": "❌"}.get(w['status'], "❓")
             text += f"• {st} {w['coins']} монет\n"
     
-    if not subs and not wds:
+    if not txs and not subs and not wds:
         text += "<i>Пока пусто</i>"
     
-    await callback.message.edit_text(text, reply_markup=kb.get_back_button("my_balance"), parse_mode="HTML")
+    await callback.message.edit_text(text, reply_markup=kb.get_history_menu(), parse_mode="HTML")
+    await callback.answer()
+
+ARCHIVE_PAGE_SIZE = 15
+
+@router.callback_query(F.data.startswith("history_archive"))
+async def history_archive(callback: CallbackQuery):
+    # history_archive или history_archive_<id последней показанной операции>
+    tail = callback.data[len("history_archive"):].lstrip("_")
+    before_id = int(tail) if tail.isdigit() else None
+    txs = await db.get_archived_transactions(callback.from_user.id, ARCHIVE_PAGE_SIZE, before_id)
+    
+    text = "🗄 <b>Старые операции</b>\n\n"
+    if before_id is None:
+        totals = await db.get_archived_totals(callback.from_user.id)
+        if totals:
+            text += (
+                f"В архиве: {totals['archived_count']} операций\n"
+                f"Итого монет: {totals['archived_real']:+}, серебра: {totals['archived_demo']:+}\n\n"
+            )
+    
+    if txs:
+        for t in txs:
+            demo = " (демо)" if t['type'] == 'demo' else ""
+            date = str(t['created_at'])[:10]
+            text += f"• {date} {t['amount']:+} {t['description'] or ''}{demo}\n"
+    else:
+        text += "<i>Больше операций нет</i>"
+    
+    next_before = txs[-1]['id'] if len(txs) == ARCHIVE_PAGE_SIZE else None
+    await callback.message.edit_text(text, reply_markup=kb.get_archive_history_nav(next_before), parse_mode="HTML")
     await callback.answer()
 
 @router.callback_query(F.data == "my_submissions")
@@ -554,4 +597,11 @@ async def my_submissions(callback: CallbackQuery):
         text += "<i>Нет заявок</i>"
     
     await callback.message.edit_text(text, reply_markup=kb.get_back_button("tasks_menu"), parse_mode="HTML")
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+# ===== БЛОКИРОВКА БОТА =====
+@router.my_chat_member(F.chat.type == "private")
+async def bot_membership_changed(event: ChatMemberUpdated):
+    # Доступность отмечает middlewares.ReachabilityMiddleware. Обработчик нужен, чтобы
+    # my_chat_member попал в allowed_updates: Telegram присылает только запрошенные типы
+    pass
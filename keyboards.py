@@ -1,6 +1,6 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from typing import List, Dict
+from typing import List, Dict, Optional
 import math
 
 from config import (
@@ -66,6 +66,20 @@ def get_balance_menu(is_youtuber: bool = False) -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_history_menu() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🗄 Старые операции", callback_data="history_archive")],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="my_balance")]
+    ])
+
+def get_archive_history_nav(before_id: Optional[int]) -> InlineKeyboardMarkup:
+    """before_id — id последней показанной операции, с него продолжается архив"""
+    buttons = []
+    if before_id:
+        buttons.append([InlineKeyboardButton(text="▶️ Ещё", callback_data=f"history_archive_{before_id}")])
+    buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="balance_history")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 def get_withdraw_packs(user_balance: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     for pack_id, pack in WITHDRAW_PACKS.items():
@@ -98,7 +112,21 @@ def get_tasks_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
     ])
 
-def get_game_tasks_list(tasks: List[Dict], page: int, total: int) -> InlineKeyboardMarkup:
+def get_page_nav(prefix: str, page: int, total: int, prev_cursor: Optional[str],
+                 next_cursor: Optional[str]) -> List[InlineKeyboardButton]:
+    """Кнопки ◀️ N/M ▶️: в callback_data номер страницы и курсор, например open_orders_2_a2026...."""
+    total_pages = max(math.ceil(total / TASKS_PER_PAGE), page + 1)
+    nav = []
+    if prev_cursor:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}_{page-1}_{prev_cursor}"))
+    nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="none"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}_{page+1}_{next_cursor}"))
+    return nav
+
+def get_game_tasks_list(tasks: List[Dict], page: int, total: int,
+                        prev_cursor: Optional[str] = None,
+                        next_cursor: Optional[str] = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for task in tasks:
@@ -110,20 +138,15 @@ def get_game_tasks_list(tasks: List[Dict], page: int, total: int) -> InlineKeybo
         ))
     
     # Пагинация
-    total_pages = math.ceil(total / TASKS_PER_PAGE)
-    if total_pages > 1:
-        nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"game_tasks_{page-1}"))
-        nav_buttons.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="none"))
-        if page < total_pages - 1:
-            nav_buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"game_tasks_{page+1}"))
-        builder.row(*nav_buttons)
+    if prev_cursor or next_cursor:
+        builder.row(*get_page_nav("game_tasks", page, total, prev_cursor, next_cursor))
     
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="tasks_menu"))
     return builder.as_markup()
 
-def get_card_tasks_list(tasks: List[Dict], page: int, total: int) -> InlineKeyboardMarkup:
+def get_card_tasks_list(tasks: List[Dict], page: int, total: int,
+                        prev_cursor: Optional[str] = None,
+                        next_cursor: Optional[str] = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for task in tasks:
@@ -132,15 +155,8 @@ def get_card_tasks_list(tasks: List[Dict], page: int, total: int) -> InlineKeybo
             callback_data=f"view_card_task_{task['id']}"
         ))
     
-    total_pages = math.ceil(total / TASKS_PER_PAGE)
-    if total_pages > 1:
-        nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"card_tasks_{page-1}"))
-        nav_buttons.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="none"))
-        if page < total_pages - 1:
-            nav_buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"card_tasks_{page+1}"))
-        builder.row(*nav_buttons)
+    if prev_cursor or next_cursor:
+        builder.row(*get_page_nav("card_tasks", page, total, prev_cursor, next_cursor))
     
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="tasks_menu"))
     return builder.as_markup()
@@ -303,6 +319,7 @@ def get_admin_panel(is_main: bool = False) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🛒 Управление рынком", callback_data="admin_market")],
         [InlineKeyboardButton(text="👥 Пользователи", callback_data="manage_users")],
         [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="⚡ Производительность", callback_data="admin_perf")],
     ]
     
     if is_main:
@@ -312,6 +329,21 @@ def get_admin_panel(is_main: bool = False) -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="◀️ Главное меню", callback_data="main_menu")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_admin_stats_menu() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Пересчитать", callback_data="admin_stats_rebuild")],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_panel")]
+    ])
+
+def get_admin_perf_menu() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_perf"),
+            InlineKeyboardButton(text="🗑 Сбросить", callback_data="admin_perf_reset")
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_panel")]
+    ])
+
 def get_admin_promos_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="➕ Создать промокод", callback_data="create_promo")],
@@ -458,7 +490,9 @@ def get_confirm_buttons(action: str) -> InlineKeyboardMarkup:
     ])
 
 # ===== ЗАКАЗЫ =====
-def get_orders_list(orders: List[Dict], page: int, total: int) -> InlineKeyboardMarkup:
+def get_orders_list(orders: List[Dict], page: int, total: int,
+                    prev_cursor: Optional[str] = None,
+                    next_cursor: Optional[str] = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for order in orders:
@@ -469,15 +503,8 @@ def get_orders_list(orders: List[Dict], page: int, total: int) -> InlineKeyboard
             callback_data=f"view_order_{order['id']}"
         ))
     
-    total_pages = math.ceil(total / TASKS_PER_PAGE)
-    if total_pages > 1:
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton(text="◀️", callback_data=f"open_orders_{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="none"))
-        if page < total_pages - 1:
-            nav.append(InlineKeyboardButton(text="▶️", callback_data=f"open_orders_{page+1}"))
-        builder.row(*nav)
+    if prev_cursor or next_cursor:
+        builder.row(*get_page_nav("open_orders", page, total, prev_cursor, next_cursor))
     
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="tasks_menu"))
     return builder.as_markup()
@@ -590,6 +617,11 @@ def get_sub_channels_admin_list(channels: List[Dict]) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 # ===== РАССЫЛКА =====
+def get_broadcast_progress(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Остановить", callback_data=f"cancel_broadcast_{job_id}")]
+    ])
+
 def get_broadcast_confirm() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
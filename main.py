@@ -1,10 +1,18 @@
 import asyncio
 import logging
+import signal
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, BOT_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+)
 import database as db
+import background
+import broadcast
+from storage import SQLiteStorage
+from middlewares import ReachabilityMiddleware, setup_timing
+from webapp import create_app
 from handlers import user, admin, games, tasks, market, teams
 
 logging.basicConfig(
@@ -13,15 +21,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def main():
-    # Инициализация БД
-    await db.init_db()
-    logger.info("✅ База данных готова")
-    
-    # Создание бота
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    
+async def run_polling(bot: Bot, dp: Dispatcher):
+    await bot.delete_webhook(drop_pending_updates=True)
+    await dp.start_polling(bot)
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    app = create_app(bot, dp)
+    # Как start_polling: по SIGTERM/SIGINT выходим штатно, чтобы отработал finally в main()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logger.info("🌐 Вебхук слушает %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+    else:
+        # Локальная проверка: обновления шлёт tools/post_update.py
+        logger.warning("WEBHOOK_BASE_URL не задан, вебхук в Telegram не зарегистрирован")
+
+    try:
+        await stop.wait()
+        logger.info("Получен сигнал остановки")
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()
+        await bot.session.close()
+
+def create_dispatcher(bot: Bot, storage: SQLiteStorage) -> Dispatcher:
+    """Диспетчер со всеми middleware и роутерами (его же гоняет benchmarks/load_test.py)"""
+    dp = Dispatcher(storage=storage)
+    setup_timing(dp, bot)
+    dp.update.outer_middleware(ReachabilityMiddleware())
+
     # Регистрация роутеров
     dp.include_router(user.router)
     dp.include_router(games.router)
@@ -29,11 +71,31 @@ async def main():
     dp.include_router(market.router)
     dp.include_router(teams.router)
     dp.include_router(admin.router)
-    
-    logger.info("🚀 Бот запускается...")
-    
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    return dp
+
+async def main():
+    # Инициализация БД
+    await db.init_db()
+    logger.info("✅ База данных готова")
+
+    # Создание бота
+    bot = Bot(token=BOT_TOKEN)
+    storage = SQLiteStorage()
+    dp = create_dispatcher(bot, storage)
+    background.start_background_tasks(bot)
+    await broadcast.resume_jobs(bot)
+
+    logger.info("🚀 Бот запускается (%s)...", BOT_MODE)
+
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        await background.stop_background_tasks()
+        await storage.close()
+        await db.close_db()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Dict, List, Optional
+
+# ===== ГИСТОГРАММЫ =====
+# Верхние границы корзин (мс); последняя корзина — всё, что дольше
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    """Счётчики по фиксированным корзинам: память не растёт с числом замеров"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины, в которую попал p-й процентиль (не больше max)"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+# ===== ВРЕМЯ ТЕКУЩЕГО ОБНОВЛЕНИЯ =====
+# Накопитель {"db": сек, "api": сек, "handler": имя} для обрабатываемого обновления.
+# Ставит middlewares.TimingMiddleware, пополняют пул БД и сессия бота
+_current: ContextVar[Optional[Dict]] = ContextVar("update_timing", default=None)
+
+def begin_update() -> tuple:
+    """Заводит накопитель, возвращает (timing, token) — token отдать end_update"""
+    timing = {"db": 0.0, "api": 0.0, "handler": None}
+    return timing, _current.set(timing)
+
+def end_update(token) -> None:
+    _current.reset(token)
+
+def current() -> Optional[Dict]:
+    return _current.get()
+
+def add_time(kind: str, seconds: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing[kind] += seconds
+
+def detach() -> None:
+    """Фоновая задача наследует контекст создателя: отвязываем её от обновления"""
+    _current.set(None)
+
+async def detached(coro: Awaitable):
+    detach()
+    return await coro
+
+# ===== ОБРАБОТЧИКИ =====
+class HandlerStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.db = 0.0
+        self.api = 0.0
+
+_handlers: Dict[str, HandlerStats] = {}
+_since = time.time()
+
+def record_update(name: str, seconds: float, timing: Dict, error: bool) -> None:
+    stats = _handlers.get(name)
+    if stats is None:
+        stats = _handlers[name] = HandlerStats()
+    stats.latency.add(seconds * 1000)
+    stats.db += timing["db"]
+    stats.api += timing["api"]
+    if error:
+        stats.errors += 1
+
+def get_handler_stats() -> List[Dict]:
+    """Обработчики по убыванию суммарного времени"""
+    result = []
+    for name, stats in _handlers.items():
+        latency = stats.latency
+        result.append({
+            "name": name,
+            "count": latency.count,
+            "errors": stats.errors,
+            "total_ms": latency.total,
+            "avg_ms": latency.avg,
+            "p50_ms": latency.percentile(50),
+            "p95_ms": latency.percentile(95),
+            "p99_ms": latency.percentile(99),
+            "max_ms": latency.max,
+            "db_avg_ms": stats.db * 1000 / latency.count,
+            "api_avg_ms": stats.api * 1000 / latency.count,
+        })
+    result.sort(key=lambda item: item["total_ms"], reverse=True)
+    return result
+
+def get_stats_since() -> float:
+    return _since
+
+def reset_handler_stats() -> None:
+    global _since
+    _handlers.clear()
+    _since = time.time()
+
+# ===== ЗАПРОСЫ К БД =====
+class CallStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+
+_db_functions: Dict[str, CallStats] = {}
+_db_statements: Dict[str, CallStats] = {}
+
+def _record(registry: Dict[str, CallStats], name: str, seconds: float, rows: int) -> None:
+    stats = registry.get(name)
+    if stats is None:
+        stats = registry[name] = CallStats()
+    stats.latency.add(seconds * 1000)
+    stats.rows += rows
+
+def record_db_call(name: str, seconds: float, rows: int) -> None:
+    _record(_db_functions, name, seconds, rows)
+
+def record_statement(sql: str, seconds: float, rows: int) -> None:
+    _record(_db_statements, sql, seconds, rows)
+
+def _summary(registry: Dict[str, CallStats]) -> List[Dict]:
+    result = []
+    for name, stats in registry.items():
+        latency = stats.latency
+        result.append({
+            "name": name,
+            "count": latency.count,
+            "total_ms": latency.total,
+            "avg_ms": latency.avg,
+            "p50_ms": latency.percentile(50),
+            "p95_ms": latency.percentile(95),
+            "p99_ms": latency.percentile(99),
+            "max_ms": latency.max,
+            "rows_avg": stats.rows / latency.count,
+        })
+    result.sort(key=lambda item: item["total_ms"], reverse=True)
+    return result
+
+def get_db_function_stats() -> List[Dict]:
+    """Функции database.py по убыванию суммарного времени"""
+    return _summary(_db_functions)
+
+def get_db_statement_stats() -> List[Dict]:
+    """SQL-запросы (без параметров) по убыванию суммарного времени"""
+    return _summary(_db_statements)
+
+def reset_db_stats() -> None:
+    _db_functions.clear()
+    _db_statements.clear()
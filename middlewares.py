@@ -0,0 +1,93 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update, User
+
+import database as db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===== ПРОИЗВОДИТЕЛЬНОСТЬ ОБРАБОТЧИКОВ =====
+class TimingMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: полное время обработки, ошибки и доли БД и Bot API.
+    Имя обработчика подставляет HandlerNameMiddleware, время БД — пул, время API — ApiTimingMiddleware"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        timing, token = metrics.begin_update()
+        started = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.end_update(token)
+            name = timing["handler"] or f"unhandled:{event.event_type}"
+            metrics.record_update(name, elapsed, timing, error)
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: сообщает TimingMiddleware, какой обработчик сработал"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        timing = metrics.current()
+        if timing is not None:
+            callback = data["handler"].callback
+            # handlers.games.process_bet -> games.process_bet
+            module = callback.__module__.rsplit(".", 1)[-1]
+            timing["handler"] = f"{module}.{callback.__name__}"
+        return await handler(event, data)
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время запросов к Bot API в счёт текущего обновления"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            metrics.add_time("api", time.perf_counter() - started)
+
+def setup_timing(dp: Dispatcher, bot: Bot) -> None:
+    dp.update.outer_middleware(TimingMiddleware())
+    # Внутренние middleware корневого роутера срабатывают и для обработчиков вложенных роутеров
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerNameMiddleware())
+    bot.session.middleware(ApiTimingMiddleware())
+
+# ===== ДОСТУПНОСТЬ ПОЛЬЗОВАТЕЛЕЙ =====
+class ReachabilityMiddleware(BaseMiddleware):
+    """Любое обновление от пользователя доказывает, что он снова доступен:
+    снимает пометку reachable = FALSE, поставленную рассылкой или уведомлением"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        from_user: User = data.get("event_from_user")
+        if from_user is not None and isinstance(event, Update):
+            try:
+                await self._touch(event, from_user.id)
+            except Exception:
+                # Обработку обновления это не должно останавливать
+                logger.exception("Не удалось обновить доступность %s", from_user.id)
+        return await handler(event, data)
+
+    @staticmethod
+    async def _touch(update: Update, user_id: int) -> None:
+        member = update.my_chat_member
+        if member is not None and member.new_chat_member.status == "kicked":
+            # Это и есть блокировка бота
+            await db.mark_users_unreachable([user_id])
+            return
+        # get_user берёт строку из кэша, поэтому для доступных пользователей запроса в БД нет
+        user = await db.get_user(user_id)
+        if user and not user['reachable']:
+            await db.mark_user_reachable(user_id)
@@ -0,0 +1,143 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import database as db
+import metrics
+from config import FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_MEMORY_TTL, FSM_EXPIRE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class _Record:
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.monotonic()
+
+class SQLiteStorage(BaseStorage):
+    """FSM в таблице fsm_states: чтения из памяти, изменения копятся и пишутся
+    одной транзакцией раз в flush_interval. Потерять можно только последние flush_interval секунд"""
+
+    def __init__(self, flush_interval: float = FSM_FLUSH_INTERVAL, state_ttl: float = FSM_STATE_TTL,
+                 memory_ttl: float = FSM_MEMORY_TTL, expire_interval: float = FSM_EXPIRE_INTERVAL):
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.memory_ttl = memory_ttl
+        self.expire_interval = expire_interval
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_expire = time.monotonic()
+        self.stats = {"loads": 0, "flushes": 0, "written": 0, "expired": 0}
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _get(self, key: StorageKey) -> _Record:
+        name = self._key(key)
+        record = self._records.get(name)
+        if record is None:
+            row = await db.load_fsm_state(name)
+            self.stats["loads"] += 1
+            loaded = _Record(row[0], json.loads(row[1])) if row else _Record()
+            # Пока шло чтение, обработчик мог уже записать новое состояние
+            record = self._records.setdefault(name, loaded)
+        record.touched = time.monotonic()
+        return record
+
+    def _changed(self, key: StorageKey, record: _Record) -> None:
+        name = self._key(key)
+        record.touched = time.monotonic()
+        self._records[name] = record
+        self._dirty.add(name)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm_flush")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._changed(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._get(key)
+        record.data = copy.deepcopy(dict(data))
+        self._changed(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._get(key)).data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Пишет накопленные изменения, возвращает число ключей"""
+        if not self._dirty:
+            return 0
+        names, self._dirty = self._dirty, set()
+        rows, deleted = [], []
+        for name in names:
+            record = self._records[name]
+            if record.state is None and not record.data:
+                deleted.append(name)
+            else:
+                rows.append((name, record.state, json.dumps(record.data, ensure_ascii=False)))
+        try:
+            await db.save_fsm_states(rows, deleted)
+        except (Exception, asyncio.CancelledError):
+            # Повторим со следующим сбросом, в памяти уже актуальные значения
+            self._dirty |= names
+            raise
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(names)
+        return len(names)
+
+    def _evict_idle(self) -> None:
+        """Выгружает из памяти записанные состояния, к которым давно не обращались"""
+        deadline = time.monotonic() - self.memory_ttl
+        for name in [name for name, record in self._records.items()
+                     if record.touched < deadline and name not in self._dirty]:
+            del self._records[name]
+
+    async def expire(self) -> int:
+        """Удаляет брошенные диалоги, не менявшиеся дольше state_ttl"""
+        expired = await db.delete_stale_fsm_states(timedelta(seconds=self.state_ttl))
+        for name in expired:
+            if name not in self._dirty:
+                self._records.pop(name, None)
+        self.stats["expired"] += len(expired)
+        return len(expired)
+
+    async def _flush_loop(self) -> None:
+        # Цикл создаётся внутри обработчика — не засчитываем ему свои записи
+        metrics.detach()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+                if time.monotonic() - self._last_expire >= self.expire_interval:
+                    self._last_expire = time.monotonic()
+                    expired = await self.expire()
+                    if expired:
+                        logger.info("Удалено устаревших состояний FSM: %s", expired)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось сохранить состояния FSM")
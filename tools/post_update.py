@@ -0,0 +1,71 @@
+"""Шлёт записанные Update JSON на локальный вебхук, как это делает Telegram
+
+Запуск бота: BOT_MODE=webhook WEBHOOK_SECRET=test python main.py
+Отправка:    WEBHOOK_SECRET=test python tools/post_update.py update.json [update2.json ...]
+Без файлов:  python tools/post_update.py --text /start --user 123
+
+Файл может содержать один Update или список. Ответы бота уйдут в настоящий
+Bot API, поэтому для проверки без сети достаточно смотреть логи обработчиков.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_PORT
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_update_ids = itertools.count(int(time.time()))
+
+def text_update(text: str, user_id: int) -> dict:
+    """Минимальный Update с личным сообщением от user_id"""
+    user = {"id": user_id, "is_bot": False, "first_name": "Test", "username": f"test{user_id}"}
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+def load_updates(paths) -> list:
+    updates = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="JSON с Update или списком Update")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    parser.add_argument("--text", help="Отправить сообщение с этим текстом вместо файлов")
+    parser.add_argument("--user", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = [text_update(args.text, args.user)] if args.text else load_updates(args.files)
+    if not updates:
+        parser.error("нужны файлы с Update или --text")
+
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            started = time.perf_counter()
+            async with session.post(args.url, json=update, headers={SECRET_HEADER: args.secret}) as response:
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"update {update.get('update_id')}: HTTP {response.status} за {elapsed:.1f} мс")
+
+if __name__ == "__main__":
+    asyncio.run(main())
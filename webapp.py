@@ -0,0 +1,34 @@
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+import database as db
+from config import WEBHOOK_PATH, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = "/health"
+
+async def health(request: web.Request) -> web.Response:
+    """200, если БД отвечает; 503 — пусть платформа перезапустит процесс"""
+    try:
+        async with db.acquire() as conn:
+            await conn.execute("SELECT 1")
+    except Exception:
+        # Подробности только в лог: эндпоинт открыт всем
+        logger.exception("Проверка здоровья не прошла")
+        return web.json_response({"status": "error"}, status=503)
+    return web.json_response({"status": "ok"})
+
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """Приложение aiohttp: обновления от Telegram на WEBHOOK_PATH и проверка здоровья"""
+    app = web.Application()
+    if not WEBHOOK_SECRET:
+        # Без секрета любой, кто знает адрес, сможет слать боту поддельные обновления
+        raise RuntimeError("Для режима webhook задайте WEBHOOK_SECRET")
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    app.router.add_get(HEALTH_PATH, health)
+    setup_application(app, dp, bot=bot)
+    return app